@@ -0,0 +1,237 @@
+##################################
+# JSON query API
+#
+# The numbers of the dashboard over HTTP, for tools that would otherwise
+# scrape the page:
+#
+#   GET /idm?year=2024&depart=LIMA            annual IDM by establishment type
+#   GET /series?depart=LIMA                   monthly IDM of every establishment type
+#   GET /facilities?year=2024&depart=LIMA     facilities with their coordinates and IDM
+#   GET /ranking?year=2024&depart=LIMA&n=15   medicines in shortage, most frequent first
+#
+# Queries read the same DatasetRegistry as the dashboard: with DASHBOARD_API_PORT
+# set, streamlit_app.py serves the API from a thread of the Streamlit server
+# process. `python api.py` serves it on its own.
+#
+# Responses are cached in memory (the last RESPONSE_CACHE_ENTRIES), keyed by
+# the query and the versions of the tables it reads, so a refreshed table
+# gives new responses. Every response has an ETag; a client that sends it
+# back in If-None-Match gets an empty 304 while the data is unchanged.
+import argparse
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import data_store
+import idm
+import perf
+import registry
+import views
+#################################
+
+logger = logging.getLogger(__name__)
+
+# Local only: the API is meant for tools running next to the dashboard
+API_HOST = '127.0.0.1'
+RESPONSE_CACHE_ENTRIES = 1024
+# Longest ranking a client can ask for
+RANKING_MAX_N = 500
+
+
+# A bad request: missing or invalid parameters
+class QueryError(ValueError):
+    pass
+
+
+def _param(params, name, convert=str, default=None):
+    values = params.get(name)
+    if not values:
+        if default is not None:
+            return default
+        raise QueryError(f'Missing parameter: {name}')
+    try:
+        return convert(values[0])
+    except ValueError:
+        raise QueryError(f'Invalid {name}: {values[0]}') from None
+
+
+def _year(params):
+    year = _param(params, 'year', int)
+    if year not in views.YEARS:
+        raise QueryError(f'Unknown year: {year}')
+    return year
+
+
+def _depart(params):
+    depart = _param(params, 'depart').upper()
+    if depart not in views.DEPARTMENTS:
+        raise QueryError(f'Unknown department: {depart}')
+    return depart
+
+
+def _error(status, message):
+    return status, json.dumps({'error': message}).encode('utf-8'), None
+
+
+# float32 columns go through their shortest decimal (64.09489, not
+# 64.0948867798), the precision the tables keep
+def _records(df):
+    float32 = [col for col, dtype in df.dtypes.items() if dtype == 'float32']
+    df = df.astype(dict.fromkeys(float32, 'str')).astype(dict.fromkeys(float32, 'float64'))
+    return json.loads(df.to_json(orient='records', date_format='iso', force_ascii=False))
+
+
+class QueryAPI:
+    def __init__(self, datasets, cache_entries=RESPONSE_CACHE_ENTRIES):
+        self.datasets = datasets
+        self.cache_entries = cache_entries
+        # (path, parameters, versions) -> (body, etag), least recently used first
+        self._responses = OrderedDict()
+        # name -> (versions, structure) of the lookup structures of the latest versions
+        self._structures = {}
+        self._lock = threading.Lock()
+        # path -> (tables it reads, query)
+        self.queries = {
+            '/idm': (views.IDM_TABLES, self.query_idm),
+            '/series': (views.SERIES_TABLES, self.query_series),
+            '/facilities': (('geo_idm',), self.query_facilities),
+            '/ranking': (('ranking_ranks',), self.query_ranking),
+        }
+
+    def _structure(self, name, versions, build):
+        with self._lock:
+            built = self._structures.get(name)
+        if built is None or built[0] != versions:
+            # Two threads may build the same structure; the last one is kept
+            built = (versions, build())
+            with self._lock:
+                self._structures[name] = built
+        return built[1]
+
+    def query_idm(self, data, params):
+        year, depart = _year(params), _depart(params)
+        index = self._structure('idm_index', data.version(*views.IDM_TABLES), lambda: views.build_idm_index(data))
+        return {'año': year, 'departamento': depart,
+                **dict(zip(idm.IDM_TIPOS, views.idm_values(index, year, depart)))}
+
+    def query_series(self, data, params):
+        depart = _depart(params)
+        store = self._structure('series_store', data.version(*views.SERIES_TABLES),
+                                lambda: views.build_series_store(data))
+        return {'departamento': depart, 'rows': _records(store.depart(depart)[['tipo', 'date', 'idm']])}
+
+    def query_facilities(self, data, params):
+        year, depart = _year(params), _depart(params)
+        store = self._structure('facility_store', data.version('geo_idm'),
+                                lambda: idm.FacilityStore(data.get('geo_idm')))
+        return {'año': year, 'departamento': depart,
+                'rows': _records(store.selection(year, depart)[data_store.GEO_COLUMNS])}
+
+    def query_ranking(self, data, params):
+        year, depart = _year(params), _depart(params)
+        n = _param(params, 'n', int, views.RANKING_TOP_N)
+        if not 0 < n <= RANKING_MAX_N:
+            raise QueryError(f'n must be between 1 and {RANKING_MAX_N}')
+        store = self._structure('ranking_store', data.version('ranking_ranks'),
+                                lambda: idm.RankingStore(data.get('ranking_ranks')))
+        top = store.top(depart, year, n)[['rank', 'nombre_med_grupo', 'desabastecimientos']]
+        return {'año': year, 'departamento': depart, 'rows': _records(top)}
+
+    # (status, JSON body, etag) of a GET. Errors are not cached.
+    def get(self, path, query):
+        if path not in self.queries:
+            return _error(404, f'Unknown path: {path}')
+        tables, run = self.queries[path]
+        params = parse_qs(query)
+        data = self.datasets.snapshot()
+        key = (path, tuple(sorted((name, tuple(values)) for name, values in params.items())), data.version(*tables))
+
+        with self._lock:
+            cached = self._responses.get(key)
+            if cached is not None:
+                self._responses.move_to_end(key)
+        perf.METRICS.count(f'api{path}', hit=cached is not None)
+        if cached is not None:
+            return (200, *cached)
+
+        try:
+            body = json.dumps(run(data, params), ensure_ascii=False).encode('utf-8')
+        except QueryError as error:
+            return _error(400, str(error))
+        except registry.TableLoadError as error:
+            return _error(503, str(error))
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        with self._lock:
+            self._responses[key] = (body, etag)
+            while len(self._responses) > self.cache_entries:
+                self._responses.popitem(last=False)
+        return 200, body, etag
+
+
+# Weak comparison, as RFC 9110 asks for If-None-Match: W/ prefixes are ignored
+# and * matches any current response
+def _etag_matches(etag, if_none_match):
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag in [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Set on the subclass made by make_server
+    api = None
+
+    def do_GET(self):
+        start = time.perf_counter()
+        url = urlsplit(self.path)
+        status, body, etag = self.api.get(url.path, url.query)
+        if etag is not None and _etag_matches(etag, self.headers.get('If-None-Match', '')):
+            status, body = 304, b''
+
+        self.send_response(status)
+        if etag is not None:
+            self.send_header('ETag', etag)
+            # Clients revalidate every time; unchanged data costs a 304
+            self.send_header('Cache-Control', 'no-cache')
+        if status != 304:
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        perf.METRICS.record(f'api{url.path}', time.perf_counter() - start)
+
+    def log_message(self, format, *args):
+        logger.debug('%s %s', self.address_string(), format % args)
+
+
+def make_server(datasets, port, host=API_HOST):
+    handler = type('Handler', (_Handler,), {'api': QueryAPI(datasets)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+# Serve the API from a daemon thread, e.g. next to the dashboard
+def start_server(datasets, port, host=API_HOST):
+    server = make_server(datasets, port, host)
+    thread = threading.Thread(target=server.serve_forever, name='query-api', daemon=True)
+    thread.start()
+    logger.info('Query API on http://%s:%d', host, port)
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the dashboard queries as JSON.')
+    parser.add_argument('--port', type=int, default=8502)
+    parser.add_argument('--host', default=API_HOST)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    datasets = registry.DatasetRegistry()
+    datasets.start_warmup()
+    server = make_server(datasets, args.port, args.host)
+    logger.info('Query API on http://%s:%d', args.host, args.port)
+    server.serve_forever()
@@ -0,0 +1,71 @@
+##################################
+# Benchmark: map hover text, row-wise apply vs customdata + hovertemplate
+#
+# Run from the repository root:
+#   python -m benchmarks.bench_hover_text
+#
+# Uses the largest (año, departamento) selection of geo_idm_anual and times both
+# building the hover payload and building + serializing the four map traces.
+import timeit
+
+import plotly.graph_objects as go
+
+import charts
+import data_store
+#################################
+
+REPEAT = 5
+NUMBER = 20
+
+
+def largest_selection(geo_idm):
+    sizes = geo_idm.groupby(['año', 'departamento'], observed=True).size()
+    year, depart = sizes.idxmax()
+    return year, depart, geo_idm[(geo_idm['año'] == year) & (geo_idm['departamento'] == depart)]
+
+
+# The hover text as the map built it before
+def text_apply(df_tipo):
+    return df_tipo.apply(lambda row: f"Nombre: {row['establec']}<br>IDM: {row['dispo']}%<br>Tipo: {row['tipo']}", axis=1)
+
+
+def text_customdata(df_tipo):
+    return charts.hover_customdata(df_tipo), charts.hover_template(df_tipo['tipo'].iloc[0] if len(df_tipo) else '')
+
+
+def figure_apply(filtered_data):
+    fig = go.Figure()
+    for tipo in charts.MAP_TIPOS:
+        df_tipo = filtered_data[filtered_data['tipo'] == tipo]
+        fig.add_trace(go.Scattermapbox(
+            lat=df_tipo['latitud'], lon=df_tipo['longitud'], mode='markers',
+            text=text_apply(df_tipo), hoverinfo='text', name=tipo))
+    return fig.to_json()
+
+
+def figure_customdata(filtered_data):
+    fig = go.Figure()
+    for tipo in charts.MAP_TIPOS:
+        df_tipo = filtered_data[filtered_data['tipo'] == tipo]
+        fig.add_trace(go.Scattermapbox(
+            lat=df_tipo['latitud'], lon=df_tipo['longitud'], mode='markers',
+            customdata=charts.hover_customdata(df_tipo), hovertemplate=charts.hover_template(tipo), name=tipo))
+    return fig.to_json()
+
+
+def best_ms(func, *args):
+    return min(timeit.repeat(lambda: func(*args), repeat=REPEAT, number=NUMBER)) / NUMBER * 1000
+
+
+if __name__ == '__main__':
+    geo_idm = data_store.read_table(data_store.GEO_FILE)
+    year, depart, filtered_data = largest_selection(geo_idm)
+    by_tipo = [filtered_data[filtered_data['tipo'] == tipo] for tipo in charts.MAP_TIPOS]
+    print(f'Largest selection: {depart} {year} ({len(filtered_data)} facilities)')
+    print(f'{"step":<24}{"apply (ms)":>12}{"customdata (ms)":>18}{"speedup":>10}')
+    for step, before, after, args in [
+        ('hover payload', lambda: [text_apply(df) for df in by_tipo], lambda: [text_customdata(df) for df in by_tipo], ()),
+        ('figure + to_json', figure_apply, figure_customdata, (filtered_data,)),
+    ]:
+        before_ms, after_ms = best_ms(before, *args), best_ms(after, *args)
+        print(f'{step:<24}{before_ms:>12.2f}{after_ms:>18.2f}{before_ms / after_ms:>9.1f}x')
@@ -0,0 +1,43 @@
+##################################
+# Benchmark: workbook ingestion, pd.read_excel vs streaming conversion
+#
+# Run from the repository root:
+#   python -m benchmarks.bench_ingest
+#
+# Converts geo_idm_anual.xlsx with data_store.convert_workbook() at a few chunk
+# sizes and reports time and peak Python memory (tracemalloc) of each, next to
+# pd.read_excel() of the whole workbook. Also checks that the converted table
+# is the one read_excel() gives. Times include tracemalloc's overhead, compare
+# them with each other only.
+import time
+import tracemalloc
+
+import pandas as pd
+
+import data_store
+#################################
+
+CHUNK_SIZES = (1_000, 5_000, 20_000)
+
+
+def measure(func, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak / 1e6
+
+
+if __name__ == '__main__':
+    file_path = data_store.GEO_FILE
+    expected, seconds, peak_mb = measure(pd.read_excel, file_path)
+    print(f'{file_path}: {len(expected)} rows')
+    print(f'{"reader":<24}{"time (s)":>10}{"peak (MB)":>12}')
+    print(f'{"pd.read_excel":<24}{seconds:>10.2f}{peak_mb:>12.1f}')
+    for chunk_rows in CHUNK_SIZES:
+        _, seconds, peak_mb = measure(data_store.convert_workbook, file_path, chunk_rows)
+        print(f'{f"streaming, {chunk_rows} rows":<24}{seconds:>10.2f}{peak_mb:>12.1f}')
+    pd.testing.assert_frame_equal(data_store.read_table(file_path), data_store.compact_dtypes(expected))
+    print('Converted table matches pd.read_excel')
@@ -0,0 +1,103 @@
+##################################
+# Benchmark: full dashboard reruns, headless
+#
+# Run from the repository root:
+#   python -m benchmarks.bench_reruns
+#   python -m benchmarks.bench_reruns --passes 2 --output results.json
+#
+# Runs streamlit_app.py with Streamlit's AppTest and selects every year and
+# every department of the sidebar, one rerun each, like a user changing the
+# selection. Each pass goes through all of them, so the first pass measures
+# cold caches and later ones warm caches. Reports p50/p95/p99 of the whole
+# rerun and of every section timed with perf.section(), plus peak memory, and
+# writes them as JSON for regression checks.
+import argparse
+import json
+import platform
+import resource
+import sys
+import time
+
+import numpy as np
+import streamlit
+from streamlit.testing.v1 import AppTest
+
+import perf
+#################################
+
+APP = 'streamlit_app.py'
+OUTPUT = 'bench_reruns.json'
+TIMEOUT = 300
+PERCENTILES = (50, 95, 99)
+
+
+# Peak resident memory of this process, in MB (ru_maxrss is KB on Linux, bytes on macOS)
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1e6 if sys.platform == 'darwin' else peak / 1e3
+
+
+def summarize(seconds):
+    ms = np.array(seconds) * 1000
+    summary = {f'p{p}_ms': round(float(np.percentile(ms, p)), 3) for p in PERCENTILES}
+    summary.update(mean_ms=round(float(ms.mean()), 3), max_ms=round(float(ms.max()), 3), runs=len(ms))
+    return summary
+
+
+def run_app(at):
+    start = time.perf_counter()
+    at.run()
+    elapsed = time.perf_counter() - start
+    if at.exception:
+        raise RuntimeError(f'The app raised: {at.exception[0].value}')
+    return elapsed, dict(at.session_state[perf.SESSION_KEY])
+
+
+def bench(passes):
+    at = AppTest.from_file(APP, default_timeout=TIMEOUT)
+    cold_start, _ = run_app(at)
+    # The sidebar's first two selectboxes: año and departamento
+    years, departs = at.selectbox[0].options, at.selectbox[1].options
+
+    totals, sections, selections = [], {}, 0
+    for _ in range(passes):
+        for year in range(len(years)):
+            for depart in range(len(departs)):
+                at.selectbox[0].select_index(year)
+                at.selectbox[1].select_index(depart)
+                total, timed = run_app(at)
+                totals.append(total)
+                for name, seconds in timed.items():
+                    sections.setdefault(name, []).append(seconds)
+                selections += 1
+
+    return {
+        'app': APP,
+        'python': platform.python_version(),
+        'streamlit': streamlit.__version__,
+        'passes': passes,
+        'years': len(years),
+        'departments': len(departs),
+        'cold_start_ms': round(cold_start * 1000, 3),
+        'rerun': summarize(totals),
+        'sections': {name: summarize(seconds) for name, seconds in sections.items()},
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time dashboard reruns over every year and department.')
+    parser.add_argument('--passes', type=int, default=1, help='times to go through every selection')
+    parser.add_argument('--output', default=OUTPUT, help='JSON file for the results')
+    args = parser.parse_args()
+
+    results = bench(args.passes)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    print(f'cold start {results["cold_start_ms"]:.0f} ms, {results["rerun"]["runs"]} reruns, '
+          f'peak RSS {results["peak_rss_mb"]:.0f} MB')
+    print(f'{"":<16}' + ''.join(f'{f"p{p} (ms)":>12}' for p in PERCENTILES))
+    for name, summary in [('rerun', results['rerun'])] + list(results['sections'].items()):
+        print(f'{name:<16}' + ''.join(f'{summary[f"p{p}_ms"]:>12.1f}' for p in PERCENTILES))
+    print(f'Results written to {args.output}')
@@ -0,0 +1,68 @@
+##################################
+# Import profile: cold-start cost of the modules streamlit_app.py imports
+#
+# Run from the repository root:
+#   python -m benchmarks.import_profile
+#
+# Every module is imported in a fresh interpreter with -X importtime, so each
+# line is what that import costs on its own (shared dependencies included, the
+# lines don't add up). The last line imports them all together, as a cold
+# worker does, and is checked against COLD_START_BUDGET_SECONDS: the script
+# exits with status 1 when it goes over.
+import ast
+import subprocess
+import sys
+#################################
+
+APP = 'streamlit_app.py'
+REPEAT = 3
+# Wall time allowed for importing everything the app imports at module level
+COLD_START_BUDGET_SECONDS = 1.5
+
+
+# Modules imported at the top level of a script, in order
+def top_level_imports(path):
+    with open(path, encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            modules.append(node.module)
+    return modules
+
+
+# Cumulative microseconds -X importtime reports for a module imported alone
+def import_time_us(module):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, check=True)
+    for line in reversed(result.stderr.splitlines()):
+        parts = [part.strip() for part in line.split('|')]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1])
+    return 0
+
+
+# Best wall time of importing all modules in a fresh interpreter
+def cold_import_seconds(modules):
+    code = ('import time; start = time.perf_counter(); '
+            f'import {", ".join(modules)}; '
+            'print(time.perf_counter() - start)')
+    times = []
+    for _ in range(REPEAT):
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+        times.append(float(result.stdout.strip()))
+    return min(times)
+
+
+if __name__ == '__main__':
+    modules = top_level_imports(APP)
+    print(f'{"module":<32}{"alone (ms)":>12}')
+    for module, us in sorted(((m, import_time_us(m)) for m in modules), key=lambda item: -item[1]):
+        print(f'{module:<32}{us / 1000:>12.1f}')
+    seconds = cold_import_seconds(modules)
+    within = seconds <= COLD_START_BUDGET_SECONDS
+    print(f'{"all together":<32}{seconds * 1000:>12.1f}  budget {COLD_START_BUDGET_SECONDS * 1000:.0f} ms: '
+          f'{"ok" if within else "OVER"}')
+    sys.exit(0 if within else 1)
@@ -0,0 +1,33 @@
+##################################
+# Memory report: resident size of every registered table, as pd.read_excel
+# returns it (before) and as the registry holds it with compact dtypes (after)
+#
+# Run from the repository root:
+#   python -m benchmarks.memory_report
+import os
+
+import pandas as pd
+
+import registry
+#################################
+
+
+def megabytes(df):
+    return df.memory_usage(deep=True).sum() / 1e6
+
+
+if __name__ == '__main__':
+    datasets = registry.DatasetRegistry()
+    print(f'{"table":<16}{"rows":>8}{"before (MB)":>14}{"after (MB)":>13}{"saved":>8}')
+    total_before = total_after = 0
+    for name, (file_path, columns) in registry.TABLES.items():
+        if not os.path.exists(file_path):
+            print(f'{name:<16}  missing {file_path}')
+            continue
+        before = pd.read_excel(file_path, usecols=columns)
+        after = datasets.get(name)
+        before_mb, after_mb = megabytes(before), megabytes(after)
+        total_before += before_mb
+        total_after += after_mb
+        print(f'{name:<16}{len(after):>8}{before_mb:>14.3f}{after_mb:>13.3f}{1 - after_mb / before_mb:>8.0%}')
+    print(f'{"total":<16}{"":>8}{total_before:>14.3f}{total_after:>13.3f}{1 - total_after / total_before:>8.0%}')
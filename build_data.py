@@ -0,0 +1,99 @@
+##################################
+# Build step: convert every workbook in data/ to a columnar Parquet file and
+# write the facility table partitioned by (año, departamento), the ranked
+# shortage lists, the annual IDM aggregated from facility counts and the
+# simplified department boundaries
+#
+#   python build_data.py            # only workbooks whose Parquet copy is missing or stale
+#   python build_data.py --force    # rebuild everything
+#   python build_data.py --workbook data/IDM_anual.xlsx    # only convert that workbook
+import argparse
+import glob
+import os
+import sys
+import time
+
+import data_store
+import validation
+#################################
+
+
+def build_columnar(force=False, file_paths=None):
+    if file_paths is None:
+        file_paths = sorted(glob.glob(os.path.join(data_store.DATA_DIR, '*.xlsx')))
+    for file_path in file_paths:
+        parquet_path = data_store.columnar_path(file_path)
+        if not force and data_store.is_fresh(file_path, parquet_path):
+            print(f'{file_path}: up to date')
+            continue
+        start = time.perf_counter()
+        rows = data_store.convert_workbook(file_path)
+        print(f'{file_path} -> {parquet_path} ({rows} rows, {time.perf_counter() - start:.2f}s)')
+
+
+def build_geo(force=False):
+    if not force and data_store.is_fresh(data_store.GEO_FILE, data_store.GEO_DATASET_DIR):
+        print(f'{data_store.GEO_DATASET_DIR}: up to date')
+        return
+    start = time.perf_counter()
+    data_store.build_geo_partitions()
+    print(f'{data_store.GEO_FILE} -> {data_store.GEO_DATASET_DIR}/ ({time.perf_counter() - start:.2f}s)')
+
+
+def validate_geo():
+    report = validation.validate_facilities(
+        data_store.read_table(data_store.GEO_FILE, validation.REQUIRED_COLUMNS))
+    print(f'{data_store.GEO_FILE}: {report.rows} rows, ' + ('valid' if report.ok else 'INVALID'))
+    for message in report.errors + report.warnings:
+        print(f'  {message}')
+
+
+def build_ranking(force=False):
+    if not force and data_store.is_fresh(data_store.RANKING_FILE, data_store.RANKING_RANKS_PATH):
+        print(f'{data_store.RANKING_RANKS_PATH}: up to date')
+        return
+    start = time.perf_counter()
+    data_store.build_ranking_ranks()
+    print(f'{data_store.RANKING_FILE} -> {data_store.RANKING_RANKS_PATH} ({time.perf_counter() - start:.2f}s)')
+
+
+def build_idm(force=False):
+    if not os.path.exists(data_store.IDM_FACILITY_FILE):
+        print(f'{data_store.IDM_FACILITY_FILE}: missing, the IDM_anual workbooks are used')
+        return
+    if not force and data_store.is_fresh(data_store.IDM_FACILITY_FILE, data_store.IDM_AGGREGATES_PATH):
+        print(f'{data_store.IDM_AGGREGATES_PATH}: up to date')
+        return
+    start = time.perf_counter()
+    data_store.build_idm_aggregates()
+    print(f'{data_store.IDM_FACILITY_FILE} -> {data_store.IDM_AGGREGATES_PATH} ({time.perf_counter() - start:.2f}s)')
+
+
+def build_boundaries(force=False):
+    if not os.path.exists(data_store.BOUNDARY_FILE):
+        print(f'{data_store.BOUNDARY_FILE}: missing')
+        return
+    if not force and data_store.is_fresh(data_store.BOUNDARY_FILE, data_store.BOUNDARIES_DIR):
+        print(f'{data_store.BOUNDARIES_DIR}: up to date')
+        return
+    start = time.perf_counter()
+    data_store.build_department_boundaries()
+    print(f'{data_store.BOUNDARY_FILE} -> {data_store.BOUNDARIES_DIR}/ ({time.perf_counter() - start:.2f}s)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert the Excel workbooks in data/ to Parquet.')
+    parser.add_argument('--force', action='store_true', help='rebuild files that are already up to date')
+    parser.add_argument('--workbook', action='append',
+                        help='only convert this workbook to Parquet (can be repeated)')
+    args = parser.parse_args()
+    if args.workbook:
+        # Used by registry.py to convert workbooks in separate processes
+        build_columnar(force=args.force, file_paths=args.workbook)
+        sys.exit()
+    build_columnar(force=args.force)
+    build_geo(force=args.force)
+    validate_geo()
+    build_ranking(force=args.force)
+    build_idm(force=args.force)
+    build_boundaries(force=args.force)
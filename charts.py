@@ -0,0 +1,251 @@
+##################################
+# Chart helpers shared by the dashboard and the benchmarks
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import pyarrow as pa
+#################################
+
+# Facility types drawn as separate map traces, in legend order
+MAP_TIPOS = ['Hospital', 'Centro de salud', 'Puesto de Salud', 'Otro']
+
+
+# Popup content. The name and IDM of each facility travel as customdata and
+# plotly.js fills them into the template, so no string is built per row in Python.
+def hover_template(tipo):
+    return f'Nombre: %{{customdata[0]}}<br>IDM: %{{customdata[1]}}%<br>Tipo: {tipo}<extra></extra>'
+
+
+def hover_customdata(df_tipo):
+    return df_tipo[['establec', 'dispo']].to_numpy()
+
+
+# Layout shared by the facility maps
+def _map_layout(fig, lat, lon, zoom):
+    fig.update_layout(
+        mapbox_style="carto-positron",
+        mapbox=dict(
+            center=go.layout.mapbox.Center(
+                lat=lat,
+                lon=lon
+            ),
+            zoom=zoom
+        ),
+        margin={"r":0,"t":0,"l":0,"b":0},
+        legend_title_text='Tipo de Establecimiento',
+        legend=dict(
+            orientation="h",
+            yanchor="top",
+            y=-0.05,  # Ajusta la posición vertical de la leyenda
+            xanchor="center",
+            x=0.5
+        ))
+    return fig
+
+
+# Facility map for the facilities of one (año, departamento), None if there are none
+def build_map_figure(filtered_data, zoom=6.5):
+    if filtered_data.empty:
+        return None
+
+    # Obtener la primera coordenada del dataframe filtrado
+    initial_lat = filtered_data.iloc[0]['latitud']
+    initial_lon = filtered_data.iloc[0]['longitud']
+
+    # Crear el mapa de Plotly
+    fig = go.Figure()
+
+    for tipo in MAP_TIPOS:
+        df_tipo = filtered_data[filtered_data['tipo'] == tipo]
+        fig.add_trace(go.Scattermapbox(
+            lat=df_tipo['latitud'],
+            lon=df_tipo['longitud'],
+            mode='markers',
+            marker=go.scattermapbox.Marker(size=9),
+            customdata=hover_customdata(df_tipo),  # Popup content
+            hovertemplate=hover_template(tipo),
+            name=tipo
+        ))
+
+    return _map_layout(fig, initial_lat, initial_lon, zoom)
+
+
+# Same bands as the donuts (assign_color) over a 0-100 IDM scale
+IDM_COLORSCALE = [
+    [0, '#E74C3C'], [0.5, '#E74C3C'],
+    [0.5, '#E67E22'], [0.7, '#E67E22'],
+    [0.7, '#F39C12'], [0.9, '#F39C12'],
+    [0.9, '#27AE60'], [1, '#27AE60'],
+]
+CLUSTER_SIZE_RANGE = (12, 40)
+
+CLUSTER_HOVER_TEMPLATE = 'Establecimientos: %{customdata[0]}<br>IDM promedio: %{customdata[1]:.0f}%<extra></extra>'
+
+
+# Map of grid clusters (spatial.cluster_facilities): one marker per cell, its
+# size grows with the number of facilities and its colour is their mean IDM.
+# Centered like build_map_figure on the first facility of the selection.
+def build_cluster_figure(clusters, center, zoom):
+    if clusters.empty:
+        return None
+
+    counts = clusters['establecimientos'].to_numpy()
+    smallest, largest = CLUSTER_SIZE_RANGE
+    # Area proportional to the count
+    sizes = smallest + (largest - smallest) * np.sqrt(counts / counts.max())
+
+    fig = go.Figure(go.Scattermapbox(
+        lat=clusters['latitud'],
+        lon=clusters['longitud'],
+        mode='markers+text',
+        marker=go.scattermapbox.Marker(
+            size=sizes,
+            color=clusters['dispo'],
+            colorscale=IDM_COLORSCALE,
+            cmin=0,
+            cmax=100,
+            opacity=0.8,
+            colorbar=dict(title='IDM promedio', ticksuffix='%'),
+        ),
+        # As strings, so the labels read the same after a JSON round trip (snapshot.py)
+        text=counts.astype(str),
+        customdata=clusters[['establecimientos', 'dispo']].to_numpy(),
+        hovertemplate=CLUSTER_HOVER_TEMPLATE,
+        name='Establecimientos',
+        showlegend=False,
+    ))
+
+    return _map_layout(fig, center[0], center[1], zoom)
+
+
+# National map of the annual IDM of every department. boundaries is the
+# simplified GeoJSON from data_store.read_department_boundaries().
+PERU_CENTER = (-9.2, -75.0)
+
+def build_choropleth_figure(boundaries, idm_by_depart, zoom=4.2):
+    departs = list(idm_by_depart)
+    fig = go.Figure(go.Choroplethmapbox(
+        geojson=boundaries,
+        featureidkey='properties.departamento',
+        locations=departs,
+        z=[idm_by_depart[depart] for depart in departs],
+        zmin=0,
+        zmax=100,
+        colorscale=IDM_COLORSCALE,
+        marker_opacity=0.8,
+        marker_line_width=0.5,
+        colorbar=dict(title='IDM', ticksuffix='%'),
+        hovertemplate='%{location}<br>IDM: %{z:.0f}%<extra></extra>',
+    ))
+    fig.update_layout(
+        mapbox_style="carto-positron",
+        mapbox=dict(center=go.layout.mapbox.Center(lat=PERU_CENTER[0], lon=PERU_CENTER[1]), zoom=zoom),
+        margin={"r":0,"t":0,"l":0,"b":0},
+        height=600)
+    return fig
+
+
+#################################
+# Donut chart
+def assign_color(idm_value):
+    if idm_value >= 90:
+        return ['#27AE60', '#12783D']  # Verde
+    elif idm_value >= 70:
+        return ['#F39C12', '#875A12']  # Amarillo
+    elif idm_value >= 50:
+        return ['#E67E22', '#B35418']  # Naranja
+    else:
+        return ['#E74C3C', '#781F16']  # Rojo
+
+
+# Layers of one donut: background ring, value ring and the centred label.
+# bg_source and source say where each layer takes its two rows from.
+def _donut_layers(idm_value, departamento, bg_source, source):
+    chart_color = assign_color(idm_value)
+    idm_value_int = int(round(idm_value))
+
+    encoding = {
+        "color": {
+            "field": "Topic",
+            "legend": None,
+            "scale": {"domain": [departamento, ''], "range": chart_color},
+            "type": "nominal"
+        },
+        "theta": {"field": "% value", "type": "quantitative"}
+    }
+    return [
+        dict(bg_source, **{
+            "mark": {"type": "arc", "cornerRadius": 20, "innerRadius": 45},
+            "encoding": encoding
+        }),
+        dict(source, **{
+            "mark": {"type": "arc", "cornerRadius": 25, "innerRadius": 45},
+            "encoding": encoding
+        }),
+        dict(source, **{
+            "mark": {"type": "text", "align": "center", "color": chart_color[0], "font": "serif",
+                     "fontSize": 30, "fontStyle": "normal", "fontWeight": 700},
+            "encoding": dict(encoding, text={"value": f'{idm_value_int}%'})
+        })
+    ]
+
+
+# Vega-Lite spec of the donut, the same one Streamlit got from the old
+# alt.Chart layers, with only the value, the department and the colours filled
+# in. Specs are cached per (idm_value, departamento), so a rerun neither builds
+# DataFrames nor runs Altair's schema validation. Render with st.vega_lite_chart;
+# the returned dict is shared and must not be modified.
+DONUT_CACHE_SIZE = 512
+
+@lru_cache(maxsize=DONUT_CACHE_SIZE)
+def make_donut(idm_value, departamento):
+    source = pa.Table.from_pandas(pd.DataFrame({
+        "Topic": ['', departamento],
+        "% value": [100 - idm_value, idm_value]
+    }))
+    source_bg = pa.Table.from_pandas(pd.DataFrame({
+        "Topic": ['', departamento],
+        "% value": [100, 0]
+    }))
+    return {
+        "layer": _donut_layers(idm_value, departamento,
+                               {"data": {"name": "source_bg"}}, {"data": {"name": "source"}}),
+        "height": 130,
+        "width": 130,
+        "$schema": "https://vega.github.io/schema/vega-lite/v5.14.1.json",
+        "datasets": {"source_bg": source_bg, "source": source}
+    }
+
+
+# Several donuts stacked in one chart, e.g. the four IDM gauges of a
+# department. donuts is a tuple of (title, idm_value) pairs; every donut reads
+# its rows from one shared dataset, so the browser gets a single spec and a
+# single dataset instead of one of each per gauge.
+@lru_cache(maxsize=DONUT_CACHE_SIZE)
+def make_donuts(donuts, departamento):
+    def rows_of(serie):
+        return {"data": {"name": "donuts"}, "transform": [{"filter": {"field": "serie", "equal": serie}}]}
+
+    rows = {"serie": [], "Topic": [], "% value": []}
+    views = []
+    for position, (title, idm_value) in enumerate(donuts):
+        for serie, values in [(f'{position}_bg', [100, 0]), (str(position), [100 - idm_value, idm_value])]:
+            rows["serie"] += [serie, serie]
+            rows["Topic"] += ['', departamento]
+            rows["% value"] += values
+
+        views.append({
+            "title": {"text": title, "anchor": "start", "fontWeight": "normal"},
+            "layer": _donut_layers(idm_value, departamento, rows_of(f'{position}_bg'), rows_of(str(position))),
+            "height": 130,
+            "width": 130
+        })
+    return {
+        "vconcat": views,
+        # Every donut has its own colours
+        "resolve": {"scale": {"color": "independent", "theta": "independent"}},
+        "$schema": "https://vega.github.io/schema/vega-lite/v5.14.1.json",
+        "datasets": {"donuts": pa.Table.from_pandas(pd.DataFrame(rows))}
+    }
@@ -0,0 +1,547 @@
+##################################
+# Columnar data store
+#
+# The Excel workbooks in data/ are still the source of truth. build_data.py
+# converts each of them to a typed, zstd-compressed Parquet file under
+# data/columnar/, and read_table() reads those files (memory mapped, only the
+# requested columns) instead of parsing the workbook XML on every cold start.
+#
+# Every generated file records the fingerprint (mtime, size, sha256) of the
+# workbook it was built from, and is rebuilt once the workbook's content changes.
+#
+# Workbooks are converted in a streaming pass (convert_workbook): the sheet
+# is read row by row and parsed in chunks of CHUNK_ROWS, so peak memory
+# depends on the chunk size rather than on the size of the workbook.
+#
+# Tables come out with compact dtypes: the repeated text columns are
+# categorical (dictionary encoded in Parquet) and numbers use the smallest dtype
+# that holds them, so filters compare integer codes and less stays resident.
+#
+# The shortage ranking is aggregated offline into ranks and counts for every
+# (departamento, año), see build_ranking_ranks().
+#
+# When facility-level medicine counts are available (IDM_FACILITY_FILE), the
+# annual IDM of every department and establishment type is computed from them
+# (build_idm_aggregates()) instead of coming from the four IDM_anual workbooks.
+#
+# The facility table is also stored partitioned by (año, departamento), as a
+# Hive-style directory, so the map only reads the selection it draws.
+#
+# The department boundaries are simplified at a few tolerances and stored as
+# compact GeoJSON, so the app never reads the shapefile (or imports geopandas).
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pandas.io.parsers import TextParser
+
+import idm
+#################################
+
+DATA_DIR = 'data'
+COLUMNAR_DIR = os.path.join(DATA_DIR, 'columnar')
+
+GEO_FILE = os.path.join(DATA_DIR, 'geo_idm_anual.xlsx')
+GEO_DATASET_DIR = os.path.join(COLUMNAR_DIR, 'geo_idm_anual')
+GEO_PARTITION_COLS = ['año', 'departamento']
+# direccion and Coordenadas are never drawn, so they are left out of the partitions
+GEO_COLUMNS = ['codigo_pre', 'establec', 'tipo', 'dispo', 'longitud', 'latitud']
+
+RANKING_FILE = os.path.join(DATA_DIR, 'ranking_medicamentos_desabastecidos.xlsx')
+RANKING_RANKS_PATH = os.path.join(COLUMNAR_DIR, 'ranking_ranks.parquet')
+
+# One row per facility and year (or finer) with año, departamento, tipo and
+# the medicine counts in idm.COUNT_COLUMNS
+IDM_FACILITY_FILE = os.path.join(DATA_DIR, 'idm_establecimientos.xlsx')
+IDM_AGGREGATES_PATH = os.path.join(COLUMNAR_DIR, 'idm_aggregates.parquet')
+
+BOUNDARY_FILE = os.path.join(DATA_DIR, 'LIMITE_DEPARTAMENTO', 'LIMITE_DEP.shp')
+BOUNDARIES_DIR = os.path.join(COLUMNAR_DIR, 'departamentos')
+# Simplification tolerances in degrees, from most to least detailed
+BOUNDARY_TOLERANCES = (0.005, 0.02, 0.05)
+# Decimals kept in the coordinates (4 = about 11 m)
+BOUNDARY_DECIMALS = 4
+
+# Repeated labels, stored as categories
+CATEGORICAL_COLUMNS = ['departamento', 'tipo', 'establec']
+COLUMN_DTYPES = {
+    'año': 'int16',
+    'dispo': 'int16',
+    'latitud': 'float32',
+    'longitud': 'float32',
+    'IDM': 'float32',
+    'idm': 'float32',
+}
+
+# Rows parsed at a time when converting a workbook
+CHUNK_ROWS = 10_000
+
+_build_lock = threading.Lock()
+
+# One conversion of a workbook at a time, whether a session or the background
+# refresh asks for it: path -> RLock
+_convert_locks = {}
+_convert_locks_guard = threading.Lock()
+
+
+def _convert_lock(file_path):
+    with _convert_locks_guard:
+        return _convert_locks.setdefault(os.path.abspath(file_path), threading.RLock())
+
+
+# Unique temporary file next to path, renamed over it when the block ends
+# without error, so a reader never sees half a file and two writers never
+# share a temporary file
+@contextmanager
+def _replacing(path):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=os.path.basename(path) + '.', suffix='.tmp')
+    os.close(fd)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def columnar_path(file_path):
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    return os.path.join(COLUMNAR_DIR, name + '.parquet')
+
+
+def compact_dtypes(df):
+    dtypes = {col: 'category' for col in CATEGORICAL_COLUMNS if col in df.columns}
+    for col, dtype in COLUMN_DTYPES.items():
+        # Integer dtypes can't hold missing values, leave such columns as they are
+        if col in df.columns and (dtype.startswith('float') or df[col].notna().all()):
+            dtypes[col] = dtype
+    return df.astype(dtypes)
+
+
+#################################
+# Source fingerprints
+
+# Fingerprint of a source file. The content hash is only computed when the
+# stat doesn't match the known fingerprint.
+def fingerprint(file_path, known=None):
+    stat = os.stat(file_path)
+    if known is not None and (known['mtime_ns'], known['size']) == (stat.st_mtime_ns, stat.st_size):
+        return known
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha256': digest.hexdigest()}
+
+
+# Files record their source next to them, directories inside them
+def _source_record_path(artifact_path):
+    if os.path.isdir(artifact_path):
+        return os.path.join(artifact_path, '_source.json')
+    return artifact_path + '.source.json'
+
+
+def read_source_record(artifact_path):
+    try:
+        with open(_source_record_path(artifact_path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_source_record(artifact_path, source):
+    with _replacing(_source_record_path(artifact_path)) as tmp_path:
+        with open(tmp_path, 'w') as f:
+            json.dump(source, f)
+
+
+# A generated file is fresh while the workbook it was built from keeps the same content
+def is_fresh(file_path, artifact_path):
+    if not os.path.exists(artifact_path):
+        return False
+    if not os.path.exists(file_path):
+        return True
+    recorded = read_source_record(artifact_path)
+    if recorded is None:
+        return False
+    current = fingerprint(file_path, recorded)
+    if current['sha256'] != recorded['sha256']:
+        return False
+    if current != recorded:
+        # Touched but unchanged (e.g. a new checkout): keep the new stat so the
+        # file isn't hashed again next time
+        try:
+            write_source_record(artifact_path, current)
+        except OSError:
+            pass
+    return True
+
+
+#################################
+# Columnar tables
+
+def write_columnar(df, parquet_path, source):
+    os.makedirs(os.path.dirname(parquet_path), exist_ok=True)
+    df = compact_dtypes(df)
+    with _replacing(parquet_path) as tmp_path:
+        df.to_parquet(tmp_path, engine='pyarrow', compression='zstd', index=False)
+    write_source_record(parquet_path, source)
+
+
+#################################
+# Streaming workbook conversion
+#
+# Gives the same table as pd.read_excel() followed by compact_dtypes(): cells
+# are converted like pandas' openpyxl reader does and every chunk goes through
+# the same text parser. Chunks are parsed on their own, so a column can come
+# out as int in one chunk and float or object in another, and a row wider than
+# the header adds 'Unnamed: N' columns from its chunk on. The first pass
+# spills the parsed chunks to disk and records what each column held; the
+# second one casts every chunk to the dtypes of the whole column and appends
+# it to the Parquet file.
+
+# Cell value as pandas' openpyxl reader returns it
+def _cell_value(cell):
+    if cell.value is None:
+        return ''
+    if cell.data_type == 'e':
+        return np.nan
+    if cell.data_type == 'n':
+        value = int(cell.value)
+        return value if value == cell.value else float(cell.value)
+    return cell.value
+
+
+# Rows of the first sheet, with trailing empty cells trimmed and blank rows skipped
+def _sheet_rows(file_path):
+    import openpyxl
+
+    book = openpyxl.load_workbook(file_path, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheet = book.worksheets[0]
+        sheet.reset_dimensions()
+        for row in sheet.rows:
+            values = [_cell_value(cell) for cell in row]
+            while values and values[-1] == '':
+                values.pop()
+            if values:
+                yield values
+    finally:
+        book.close()
+
+
+# Parsed DataFrames of at most chunk_rows rows each
+def iter_workbook_chunks(file_path, chunk_rows=CHUNK_ROWS):
+    rows = _sheet_rows(file_path)
+    header = next(rows, None)
+    if header is None:
+        return
+    columns = None
+    chunk = [header]
+    for row in rows:
+        chunk.append(row)
+        # The first chunk also holds the header
+        if len(chunk) - (columns is None) == chunk_rows:
+            columns, df = _parse_chunk(chunk, columns)
+            yield df
+            chunk = []
+    if chunk:
+        yield _parse_chunk(chunk, columns)[1]
+
+
+# Rows are padded to the widest row seen so far, like pd.read_excel pads them
+# to the widest row of the sheet: cells past the header are kept in
+# 'Unnamed: N' columns, which a later chunk may add
+def _parse_chunk(rows, columns):
+    width = max([len(row) for row in rows] + [len(columns) if columns is not None else 0])
+    rows = [row + [''] * (width - len(row)) for row in rows]
+    if columns is None:
+        # First chunk: the header row names the columns ('Unnamed: 0', ...)
+        df = TextParser(rows, header=0).read()
+    else:
+        names = columns + [f'Unnamed: {position}' for position in range(len(columns), width)]
+        df = TextParser(rows, header=None, names=names).read()
+    return list(df.columns), df
+
+
+# dtype a column gets in the whole table, from the dtypes it got in each chunk
+def _merged_dtype(dtypes):
+    dtypes = set(dtypes)
+    if len(dtypes) == 1:
+        return dtypes.pop()
+    if all(pd.api.types.is_integer_dtype(d) or pd.api.types.is_float_dtype(d) for d in dtypes):
+        return np.dtype('float64')
+    return np.dtype('object')
+
+
+# Final dtype of every column: merged chunk dtypes, then compact_dtypes'
+# rules applied to the whole column rather than to each chunk
+def _table_dtypes(chunk_dtypes, has_nulls, categories):
+    dtypes = {col: _merged_dtype(seen) for col, seen in chunk_dtypes.items()}
+    for col, values in categories.items():
+        try:
+            values = sorted(values)
+        except TypeError:
+            values = list(values)
+        dtypes[col] = pd.CategoricalDtype(values)
+    for col, dtype in COLUMN_DTYPES.items():
+        if col in dtypes and (dtype.startswith('float') or not has_nulls[col]):
+            dtypes[col] = dtype
+    return dtypes
+
+
+# Arrow schema of the whole table. A column without values in one chunk (e.g.
+# an 'Unnamed: N' column a later chunk added) is null there and takes its type
+# from the chunks that have some.
+def _table_schema(spilled, columns, dtypes):
+    schemas = []
+    for path in spilled:
+        with open(path, 'rb') as f:
+            chunk = pickle.load(f).reindex(columns=columns).astype(dtypes)
+        schemas.append(pa.Schema.from_pandas(chunk, preserve_index=False))
+        if not any(pa.types.is_null(field.type) for field in schemas[0]):
+            break
+    return pa.unify_schemas(schemas)
+
+
+def convert_workbook(file_path, chunk_rows=CHUNK_ROWS):
+    with _convert_lock(file_path):
+        return _convert_workbook(file_path, chunk_rows)
+
+
+def _convert_workbook(file_path, chunk_rows):
+    # Fingerprint first: if the workbook changes while it is read, the copy is stale
+    source = fingerprint(file_path)
+    parquet_path = columnar_path(file_path)
+    os.makedirs(os.path.dirname(parquet_path), exist_ok=True)
+
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(parquet_path)) as spill_dir:
+        spilled, chunk_dtypes, has_nulls, categories = [], {}, {}, {}
+        for number, chunk in enumerate(iter_workbook_chunks(file_path, chunk_rows)):
+            for col in chunk.columns:
+                chunk_dtypes.setdefault(col, []).append(chunk[col].dtype)
+                has_nulls[col] = has_nulls.get(col, False) or bool(chunk[col].isna().any())
+                if col in CATEGORICAL_COLUMNS:
+                    categories.setdefault(col, set()).update(chunk[col].dropna().unique())
+            path = os.path.join(spill_dir, f'{number}.pkl')
+            with open(path, 'wb') as f:
+                pickle.dump(chunk, f, protocol=pickle.HIGHEST_PROTOCOL)
+            spilled.append(path)
+
+        if not spilled:
+            # Empty sheet
+            write_columnar(pd.DataFrame(), parquet_path, source)
+            return 0
+
+        # Columns a later chunk added are missing (NaN) in the earlier ones
+        columns = list(chunk_dtypes)
+        for col, seen in chunk_dtypes.items():
+            if len(seen) < len(spilled):
+                seen.append(np.dtype('float64'))
+                has_nulls[col] = True
+        dtypes = _table_dtypes(chunk_dtypes, has_nulls, categories)
+        schema = _table_schema(spilled, columns, dtypes)
+        rows = 0
+        with _replacing(parquet_path) as tmp_path:
+            with pq.ParquetWriter(tmp_path, schema, compression='zstd') as writer:
+                for path in spilled:
+                    with open(path, 'rb') as f:
+                        chunk = pickle.load(f).reindex(columns=columns).astype(dtypes)
+                    writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+                    rows += len(chunk)
+                    os.remove(path)
+    write_source_record(parquet_path, source)
+    return rows
+
+
+# True when read_table() would have to parse the workbook
+def needs_parse(file_path):
+    return not is_fresh(file_path, columnar_path(file_path))
+
+
+def read_table(file_path, columns=None):
+    parquet_path = columnar_path(file_path)
+    if not is_fresh(file_path, parquet_path):
+        # Fallback: convert the workbook now and keep the columnar copy for the next start
+        with _convert_lock(file_path):
+            # Unless another thread converted it while this one waited
+            if not is_fresh(file_path, parquet_path):
+                try:
+                    convert_workbook(file_path)
+                except OSError:
+                    # Nowhere to write it: parse the whole workbook in memory
+                    df = pd.read_excel(file_path)
+                    if columns is not None:
+                        df = df[[c for c in df.columns if c in columns]]
+                    return compact_dtypes(df)
+
+    if columns is not None:
+        # Like the Excel fallback, leave out requested columns the table doesn't
+        # have, so the caller (e.g. validation.py) can report them
+        present = set(pq.read_schema(parquet_path).names)
+        columns = [col for col in columns if col in present]
+    table = pq.read_table(parquet_path, columns=columns, memory_map=True)
+    # No-op for files written with compact dtypes, converts older ones
+    return compact_dtypes(table.to_pandas())
+
+
+#################################
+# Partitioned facility store
+
+def partition_path(dataset_dir, partition_cols, values):
+    parts = [f'{col}={value}' for col, value in zip(partition_cols, values)]
+    return os.path.join(dataset_dir, *parts, 'part-0.parquet')
+
+
+def write_partitioned(df, dataset_dir, partition_cols, source):
+    os.makedirs(os.path.dirname(dataset_dir), exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(dataset_dir), prefix=os.path.basename(dataset_dir) + '.', suffix='.tmp')
+    old_dir = tmp_dir + '.old'
+    try:
+        for values, part in df.groupby(partition_cols, sort=True, observed=True):
+            path = partition_path(tmp_dir, partition_cols, values)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Each file only gets the categories its own rows use
+            part = part.drop(columns=partition_cols)
+            part = part.apply(lambda col: col.cat.remove_unused_categories() if col.dtype == 'category' else col)
+            part.to_parquet(path, engine='pyarrow', compression='zstd', index=False)
+        write_source_record(tmp_dir, source)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    # Swap the whole directory in at once. The directory is briefly missing,
+    # so readers hold the same lock.
+    with _build_lock:
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(dataset_dir):
+            os.replace(dataset_dir, old_dir)
+        os.replace(tmp_dir, dataset_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+# Partition the facility table. df and source are those of a table already
+# read (the registry passes the one it loaded), otherwise GEO_FILE is read.
+def build_geo_partitions(df=None, source=None):
+    if df is None:
+        source = fingerprint(GEO_FILE)
+        df = read_table(GEO_FILE, GEO_PARTITION_COLS + GEO_COLUMNS)
+    write_partitioned(df, GEO_DATASET_DIR, GEO_PARTITION_COLS, source)
+
+
+# Facilities of one (año, departamento). Partitions are only written by
+# build_data.py and the registry; reading never rebuilds them. With sha256
+# (the fingerprint of the workbook the caller loaded), returns None when the
+# partitions were built from other content.
+def read_geo_partition(year, depart, sha256=None):
+    path = partition_path(GEO_DATASET_DIR, GEO_PARTITION_COLS, [year, depart])
+    with _build_lock:
+        if sha256 is not None and (read_source_record(GEO_DATASET_DIR) or {}).get('sha256') != sha256:
+            return None
+        if not os.path.exists(path):
+            return pd.DataFrame(columns=GEO_COLUMNS)
+        df = pq.read_table(path, columns=GEO_COLUMNS, memory_map=True).to_pandas()
+    return compact_dtypes(df)
+
+
+#################################
+# Shortage ranking, ranked per (departamento, año)
+
+def build_ranking_ranks():
+    source = fingerprint(RANKING_FILE)
+    ranking = read_table(RANKING_FILE, ['departamento', 'año', 'nombre_med_grupo'])
+    write_columnar(idm.rank_shortages(ranking), RANKING_RANKS_PATH, source)
+
+
+def read_ranking_ranks():
+    with _build_lock:
+        if not is_fresh(RANKING_FILE, RANKING_RANKS_PATH):
+            build_ranking_ranks()
+    return compact_dtypes(pq.read_table(RANKING_RANKS_PATH, memory_map=True).to_pandas())
+
+
+#################################
+# Annual IDM aggregated from facility counts
+
+def build_idm_aggregates():
+    source = fingerprint(IDM_FACILITY_FILE)
+    facilities = read_table(IDM_FACILITY_FILE, ['año', 'departamento', 'tipo'] + idm.COUNT_COLUMNS)
+    write_columnar(idm.aggregate_idm(facilities), IDM_AGGREGATES_PATH, source)
+
+
+# Long annual IDM table (idm.AGGREGATE_COLUMNS), empty without facility counts
+def read_idm_aggregates():
+    with _build_lock:
+        if not os.path.exists(IDM_FACILITY_FILE) and not os.path.exists(IDM_AGGREGATES_PATH):
+            return pd.DataFrame(columns=idm.AGGREGATE_COLUMNS)
+        if not is_fresh(IDM_FACILITY_FILE, IDM_AGGREGATES_PATH):
+            build_idm_aggregates()
+    return compact_dtypes(pq.read_table(IDM_AGGREGATES_PATH, memory_map=True).to_pandas())
+
+
+#################################
+# Department boundaries
+
+def boundaries_path(tolerance):
+    return os.path.join(BOUNDARIES_DIR, f'departamentos_{tolerance:g}.geojson')
+
+
+# Same department names as the workbooks ('LA LIBERTAD' -> 'LALIBERTAD')
+def depart_key(name):
+    return name.replace(' ', '').upper()
+
+
+def build_department_boundaries():
+    import geopandas as gpd
+    import shapely
+
+    source = fingerprint(BOUNDARY_FILE)
+    departments = gpd.read_file(BOUNDARY_FILE).to_crs(epsg=4326)
+    names = departments['NOMBDEP'].map(depart_key)
+    geometry = departments.geometry.to_numpy()
+
+    # Simplify the departments as one coverage, so neighbours keep the same
+    # shared border (no gaps or overlaps between them). That needs borders that
+    # match exactly; otherwise each polygon is simplified on its own.
+    as_coverage = bool(shapely.coverage_is_valid(geometry))
+
+    os.makedirs(BOUNDARIES_DIR, exist_ok=True)
+    for tolerance in BOUNDARY_TOLERANCES:
+        if as_coverage:
+            simplified = shapely.coverage_simplify(geometry, tolerance)
+        else:
+            simplified = shapely.simplify(geometry, tolerance, preserve_topology=True)
+        simplified = shapely.transform(simplified, lambda coords: np.round(coords, BOUNDARY_DECIMALS))
+        features = [
+            {'type': 'Feature', 'properties': {'departamento': name}, 'geometry': json.loads(shapely.to_geojson(geom))}
+            for name, geom in zip(names, simplified)
+        ]
+        with _replacing(boundaries_path(tolerance)) as tmp_path:
+            with open(tmp_path, 'w') as f:
+                json.dump({'type': 'FeatureCollection', 'features': features}, f, separators=(',', ':'))
+    write_source_record(BOUNDARIES_DIR, source)
+
+
+# Identifies the built boundaries (sha256 of the shapefile they were built
+# from), None before build_data.py builds them. Caches of them are keyed by it.
+def boundaries_version():
+    return (read_source_record(BOUNDARIES_DIR) or {}).get('sha256')
+
+
+# Simplified department boundaries as a GeoJSON dict, None if they weren't
+# built. Only build_data.py (and snapshot.py) build them: geopandas is never
+# imported by the dashboard.
+def read_department_boundaries(tolerance):
+    try:
+        with open(boundaries_path(tolerance)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
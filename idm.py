@@ -0,0 +1,151 @@
+##################################
+# IDM lookup structures, built once when the data is loaded
+import numpy as np
+import pandas as pd
+#################################
+
+# Order of the values returned for every (año, departamento) key
+IDM_TIPOS = ('total', 'hospitales', 'centros', 'puestos')
+
+
+# Row range of every key in a table sorted by the key columns. Keys are the
+# value of the single column, or a tuple of values for several columns.
+def _row_slices(data, columns):
+    if data.empty:
+        return {}
+    changed = np.zeros(len(data) - 1, dtype=bool)
+    for col in columns:
+        values = data[col].to_numpy()
+        changed |= values[1:] != values[:-1]
+    starts = [0] + (changed.nonzero()[0] + 1).tolist()
+    stops = starts[1:] + [len(data)]
+    keys = data[columns].iloc[starts].itertuples(index=False, name=None)
+    if len(columns) == 1:
+        keys = (key[0] for key in keys)
+    return {key: slice(start, stop) for key, start, stop in zip(keys, starts, stops)}
+
+
+# Medicine counts of the annual IDM tables. IDM = 100 * disponible / total.
+COUNT_COLUMNS = ['total', 'substock', 'desabastecido', 'disponible']
+# Columns of the long annual IDM table: one row per (año, departamento, tipo),
+# tipo being one of IDM_TIPOS
+AGGREGATE_COLUMNS = ['año', 'departamento', 'tipo'] + COUNT_COLUMNS + ['IDM']
+# Facility types (as in the facility data) of the per-type tables. 'Otro' only
+# counts towards the total.
+FACILITY_TIPOS = {'hospitales': 'Hospital', 'centros': 'Centro de salud', 'puestos': 'Puesto de Salud'}
+
+
+def _ratio_idm(sums):
+    # Ratio of sums, rounded like the workbooks; no medicines -> no IDM
+    return (100 * sums['disponible'] / sums['total'].where(sums['total'] > 0)).round(2).astype('float32')
+
+
+# Annual IDM of every (año, departamento) and establishment type from
+# facility-level counts, in one group-by over the facilities. Each IDM is the
+# ratio of the summed counts, so large facilities weigh more than small ones.
+def aggregate_idm(facilities):
+    keys = ['año', 'departamento', 'tipo']
+    sums = facilities.groupby(keys, observed=True, sort=True)[COUNT_COLUMNS].sum().reset_index()
+
+    # Totals over every type, summed from the per-type sums (a few hundred rows)
+    totals = sums.groupby(['año', 'departamento'], observed=True, sort=True)[COUNT_COLUMNS].sum().reset_index()
+    totals['tipo'] = IDM_TIPOS[0]
+    by_tipo = sums[sums['tipo'].isin(list(FACILITY_TIPOS.values()))].copy()
+    by_tipo['tipo'] = by_tipo['tipo'].map({facility: tipo for tipo, facility in FACILITY_TIPOS.items()})
+
+    aggregated = pd.concat([totals, by_tipo], ignore_index=True)
+    aggregated['IDM'] = _ratio_idm(aggregated)
+    return _sort_aggregates(aggregated)
+
+
+# The same long table from the four annual workbooks, in IDM_TIPOS order
+def stack_idm_tables(idm_tables):
+    frames = [df.assign(tipo=tipo)[AGGREGATE_COLUMNS] for tipo, df in zip(IDM_TIPOS, idm_tables)]
+    return _sort_aggregates(pd.concat(frames, ignore_index=True))
+
+
+def _sort_aggregates(aggregated):
+    aggregated['tipo'] = pd.Categorical(aggregated['tipo'], categories=IDM_TIPOS)
+    aggregated['departamento'] = aggregated['departamento'].astype('category')
+    # Stable, so a key repeated in a table keeps its file order
+    return aggregated.sort_values(['año', 'departamento', 'tipo'], kind='stable', ignore_index=True)[AGGREGATE_COLUMNS]
+
+
+# Index the long annual IDM table by (año, departamento). Each key maps to a
+# tuple with the rounded IDM of every establishment type in IDM_TIPOS order,
+# or None where there is no row for that type or it has no IDM (no medicines).
+def build_idm_index(aggregated):
+    index = {}
+    positions = aggregated['tipo'].map({tipo: position for position, tipo in enumerate(IDM_TIPOS)}).tolist()
+    keys = zip(aggregated['año'].tolist(), aggregated['departamento'].tolist())
+    for key, position, value in zip(keys, positions, aggregated['IDM'].round(0).tolist()):
+        index.setdefault(key, [None] * len(IDM_TIPOS))
+        # Keep the first row for a key, like the old boolean-mask lookup did
+        if index[key][position] is None:
+            index[key][position] = value
+    return {key: tuple(None if pd.isna(value) else value for value in values) for key, values in index.items()}
+
+
+# Establishment types of the monthly IDM series, in legend order
+SERIES_TIPOS = ['Hospitales', 'Centros de Salud', 'Puestos de Salud']
+
+
+# Monthly IDM of every establishment type in one long-format table, sorted by
+# (departamento, tipo, date). The rows of a department are contiguous, so its
+# three curves are a single positional slice.
+class SeriesStore:
+    def __init__(self, series_tables):
+        frames = [
+            df[['departamento', 'date', 'idm']].assign(tipo=tipo)
+            for tipo, df in zip(SERIES_TIPOS, series_tables)
+        ]
+        data = pd.concat(frames, ignore_index=True)
+        data['tipo'] = pd.Categorical(data['tipo'], categories=SERIES_TIPOS)
+        data['departamento'] = data['departamento'].astype('category')
+        self.data = data.sort_values(['departamento', 'tipo', 'date'], ignore_index=True)
+
+        self.slices = _row_slices(self.data, ['departamento'])
+
+    def depart(self, depart):
+        return self.data.iloc[self.slices.get(depart, slice(0, 0))]
+
+
+# Rank the medicines in shortage of every (departamento, año). The shortage
+# count of a medicine is its number of rows in the raw ranking table; ties keep
+# the order of the table, so with one row per medicine the ranks are the file order.
+def rank_shortages(ranking):
+    keys = ['departamento', 'año', 'nombre_med_grupo']
+    ranked = (
+        ranking[keys]
+        .assign(orden=np.arange(len(ranking)))
+        .groupby(keys, observed=True, sort=False)
+        .agg(desabastecimientos=('orden', 'size'), orden=('orden', 'min'))
+        .reset_index()
+        .sort_values(['departamento', 'año', 'desabastecimientos', 'orden'],
+                     ascending=[True, True, False, True], ignore_index=True)
+    )
+    ranked['rank'] = ranked.groupby(['departamento', 'año'], observed=True).cumcount().astype('int16') + 1
+    return ranked[['departamento', 'año', 'rank', 'nombre_med_grupo', 'desabastecimientos']]
+
+
+# Ranked shortage lists from rank_shortages, sorted by (departamento, año, rank)
+# so the top N of a selection is the first N rows of its slice
+class RankingStore:
+    def __init__(self, ranked):
+        self.data = ranked.sort_values(['departamento', 'año', 'rank'], ignore_index=True)
+        self.slices = _row_slices(self.data, ['departamento', 'año'])
+
+    def top(self, depart, year, n):
+        rows = self.slices.get((depart, year), slice(0, 0))
+        return self.data.iloc[rows.start:min(rows.stop, rows.start + n)]
+
+
+# Facilities of the geo table sorted by (año, departamento), keeping the file
+# order within a selection, so a selection is a single positional slice
+class FacilityStore:
+    def __init__(self, facilities):
+        self.data = facilities.sort_values(['año', 'departamento'], kind='stable', ignore_index=True)
+        self.slices = _row_slices(self.data, ['año', 'departamento'])
+
+    def selection(self, year, depart):
+        return self.data.iloc[self.slices.get((year, depart), slice(0, 0))]
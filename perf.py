@@ -0,0 +1,136 @@
+##################################
+# Section timings and cache counters
+#
+# The app wraps each panel and data step in `with perf.section(name):`. Every
+# section is recorded twice: in the session state, with the seconds of the
+# last rerun of that session (read by the benchmarks), and in METRICS, a
+# process-wide rolling window of the last METRICS_WINDOW timings of every
+# section, shown by the diagnostics panel (?diagnostics=1).
+#
+# Cached loaders are declared with perf.cached(st.cache_resource(...)), which
+# counts their hits and misses in METRICS. Anything else worth counting (e.g.
+# selections without data) is an event, kept apart from the cache counters.
+import functools
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+import streamlit as st
+#################################
+
+logger = logging.getLogger(__name__)
+
+SESSION_KEY = '_perf_sections'
+# Timings kept per section
+METRICS_WINDOW = 1000
+
+
+class MetricsStore:
+    def __init__(self, window=METRICS_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        # name -> deque of seconds
+        self._timings = {}
+        # name -> [hits, misses]
+        self._counters = {}
+        # name -> occurrences
+        self._events = {}
+
+    def record(self, name, seconds):
+        with self._lock:
+            self._timings.setdefault(name, deque(maxlen=self.window)).append(seconds)
+
+    def count(self, name, hit):
+        with self._lock:
+            counter = self._counters.setdefault(name, [0, 0])
+            counter[0 if hit else 1] += 1
+
+    def event(self, name):
+        with self._lock:
+            self._events[name] = self._events.get(name, 0) + 1
+
+    # One row per section: number of timings in the window and their p50/p95/max in ms
+    def timings(self):
+        with self._lock:
+            timings = {name: np.array(values) * 1000 for name, values in self._timings.items()}
+        return [
+            {'seccion': name, 'n': len(ms), 'p50_ms': np.percentile(ms, 50),
+             'p95_ms': np.percentile(ms, 95), 'max_ms': ms.max()}
+            for name, ms in timings.items()
+        ]
+
+    # One row per counter: hits, misses and hit rate
+    def counters(self):
+        with self._lock:
+            counters = {name: tuple(counter) for name, counter in self._counters.items()}
+        return [
+            {'funcion': name, 'hits': hits, 'misses': misses, 'hit_rate': hits / (hits + misses)}
+            for name, (hits, misses) in counters.items()
+        ]
+
+    # One row per event: how many times it happened
+    def events(self):
+        with self._lock:
+            return [{'evento': name, 'n': n} for name, n in self._events.items()]
+
+
+METRICS = MetricsStore()
+
+
+# Called at the top of the script, so a section skipped in this rerun doesn't
+# keep the time of an earlier one
+def start_run():
+    st.session_state[SESSION_KEY] = {}
+
+
+# Called at the end of the script: one structured log line per rerun
+def end_run():
+    if logger.isEnabledFor(logging.DEBUG):
+        sections = st.session_state.get(SESSION_KEY, {})
+        logger.debug(json.dumps({name: round(seconds * 1000, 3) for name, seconds in sections.items()}))
+
+
+@contextmanager
+def section(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        st.session_state.setdefault(SESSION_KEY, {})[name] = seconds
+        METRICS.record(name, seconds)
+
+
+# Names of the cached functions whose body ran during the current call, per thread
+_missed = threading.local()
+
+
+# Wrap a st.cache_* decorator so calls to the function count as hits or misses
+# (the body only runs on a miss)
+def cached(cache_decorator):
+    def decorate(func):
+        name = func.__name__
+
+        @functools.wraps(func)
+        def body(*args, **kwargs):
+            _missed.names.add(name)
+            return func(*args, **kwargs)
+
+        cached_func = cache_decorator(body)
+
+        @functools.wraps(func)
+        def call(*args, **kwargs):
+            if not hasattr(_missed, 'names'):
+                _missed.names = set()
+            _missed.names.discard(name)
+            result = cached_func(*args, **kwargs)
+            METRICS.count(name, hit=name not in _missed.names)
+            return result
+
+        call.clear = cached_func.clear
+        return call
+    return decorate
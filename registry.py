@@ -0,0 +1,306 @@
+##################################
+# Process-wide dataset registry
+#
+# Every table is loaded once per server process and shared by all sessions.
+# st.cache_data would pickle a fresh copy of each DataFrame for every session
+# and rerun; the registry instead hands out shallow views of the same arrays.
+#
+# The first load runs all tables at once: workbooks that have to be parsed are
+# converted to Parquet by build_data.py in separate interpreters (openpyxl is
+# CPU bound), and every table is then read in a thread. No worker process is
+# started from this module: inside Streamlit, __main__ is the dashboard script,
+# which a spawned worker would import and run again. Results are collected in
+# TABLES order, and a table that fails is recorded as failed without stopping
+# the others, so startup ends the same way whichever worker finishes first.
+#
+# The registry also keeps the data current without a restart: every
+# REFRESH_INTERVAL seconds one session triggers a check of the source files'
+# fingerprints, and only the tables whose workbook changed are reloaded, in a
+# background thread. The new tables are swapped in together and get a new
+# version number, which caches of derived structures use as part of their key.
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import data_store
+#################################
+
+logger = logging.getLogger(__name__)
+
+# Views share memory with the loaded tables. With copy-on-write a session that
+# modifies its view gets its own copy instead of changing the shared data
+# (always on from pandas 3).
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
+# name -> (source workbook, columns to load or None for all of them)
+TABLES = {
+    'idm_anual_data': ('data/IDM_anual.xlsx', None),
+    'idm_anual_hosp': ('data/IDM_anual_hospitales.xlsx', None),
+    'idm_anual_cen': ('data/IDM_anual_centros.xlsx', None),
+    'idm_anual_pue': ('data/IDM_anual_puestos.xlsx', None),
+    'geo_idm': ('data/geo_idm_anual.xlsx', data_store.GEO_PARTITION_COLS + data_store.GEO_COLUMNS),
+    'idm_hospitales': ('data/data_lineplot_hosp.xlsx', None),
+    'idm_centros': ('data/data_lineplot_centros.xlsx', None),
+    'idm_puestos': ('data/data_lineplot_puestos.xlsx', None),
+}
+
+# Tables built from a workbook by data_store: name -> (source workbook, loader)
+DERIVED_TABLES = {
+    'ranking_ranks': (data_store.RANKING_FILE, data_store.read_ranking_ranks),
+    'idm_aggregates': (data_store.IDM_FACILITY_FILE, data_store.read_idm_aggregates),
+}
+
+# Files written from a loaded table before it is swapped in, so they always
+# match a version sessions can see: name -> (files, writer(df, source))
+WRITTEN_ON_LOAD = {
+    'geo_idm': (data_store.GEO_DATASET_DIR, data_store.build_geo_partitions),
+}
+
+# Seconds between two checks of the source files
+REFRESH_INTERVAL = 30
+
+# Workbooks converted at once on the first load, one build_data.py process each
+PARSE_WORKERS = min(4, os.cpu_count() or 1)
+BUILD_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'build_data.py')
+
+_Entry = namedtuple('_Entry', ['df', 'version', 'source', 'error'])
+
+# How a table was loaded ('parquet', 'excel', 'derived' or 'refresh'), the
+# seconds it took and the error if it failed
+LoadTiming = namedtuple('LoadTiming', ['name', 'mode', 'seconds', 'error'])
+
+
+class TableLoadError(RuntimeError):
+    pass
+
+
+# Load one table and time it
+def _load_source(file_path, how):
+    start = time.perf_counter()
+    # Fingerprint first: if the file changes while it is read, the next check reloads it
+    source = data_store.fingerprint(file_path) if os.path.exists(file_path) else None
+    if callable(how):
+        df = how()
+    else:
+        df = data_store.read_table(file_path, how)
+    return df, source, time.perf_counter() - start
+
+
+# Convert a workbook in a build_data.py process, then load its Parquet copy.
+# If the conversion fails there, _load_source converts it in this process.
+def _convert_and_load(file_path, how):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, BUILD_SCRIPT, '--workbook', file_path],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        logger.warning('Could not convert %s in a separate process: %s', file_path, result.stderr.strip())
+    df, source, _ = _load_source(file_path, how)
+    return df, source, time.perf_counter() - start
+
+
+# The tables as they were when a rerun started. A refresh in the middle of the
+# rerun doesn't change what it sees.
+class Snapshot:
+    def __init__(self, state):
+        self._state = state
+
+    def get(self, name):
+        entry = self._state[name]
+        if entry.error is not None:
+            raise TableLoadError(f'Table {name} could not be loaded: {entry.error}') from entry.error
+        return entry.df.copy(deep=False)
+
+    # Fingerprint of the workbook a table was loaded from, None without one
+    def source(self, name):
+        return self._state[name].source
+
+    # Versions of the given tables, to key caches of structures built from them
+    def version(self, *names):
+        return tuple(self._state[name].version for name in names)
+
+    # name -> error of the tables that failed to load, in TABLES order
+    @property
+    def errors(self):
+        return {name: entry.error for name, entry in self._state.items() if entry.error is not None}
+
+
+class DatasetRegistry:
+    def __init__(self, tables=TABLES, derived=DERIVED_TABLES):
+        # name -> (source file, columns or loader)
+        self.sources = {**tables, **derived}
+        # name -> _Entry. The dict is replaced, never modified, so reading
+        # self._state once gives a consistent set of tables.
+        self._state = {}
+        self._state_lock = threading.Lock()
+        self._load_locks = {name: threading.Lock() for name in self.sources}
+        self._refresh_lock = threading.Lock()
+        self._last_check = time.monotonic()
+        # name -> LoadTiming of its last load
+        self.timings = {}
+
+    def _mode(self, name):
+        file_path, how = self.sources[name]
+        if callable(how):
+            return 'derived'
+        return 'excel' if data_store.needs_parse(file_path) else 'parquet'
+
+    def _swap(self, entries):
+        with self._state_lock:
+            # Keep TABLES order, so errors and reports always list tables the same way
+            state = {**self._state, **entries}
+            self._state = {name: state[name] for name in self.sources if name in state}
+
+    def _write_on_load(self, name, df, source):
+        if name not in WRITTEN_ON_LOAD:
+            return
+        artifact_path, write = WRITTEN_ON_LOAD[name]
+        try:
+            if not data_store.is_fresh(self.sources[name][0], artifact_path):
+                write(df, source)
+        except Exception:
+            # Readers of the files check their source and fall back to the table
+            logger.exception('Could not write %s from table %s', artifact_path, name)
+
+    # Load the given tables concurrently and swap them in together
+    def _load_all(self, names):
+        modes = {name: self._mode(name) for name in names}
+        parse = [name for name in names if modes[name] == 'excel']
+        futures, results = {}, {}
+        # A single workbook is parsed in its thread, like the Parquet reads
+        converted = parse if len(parse) > 1 else []
+        with ThreadPoolExecutor(max_workers=len(names)) as threads, \
+                ThreadPoolExecutor(max_workers=PARSE_WORKERS) as converters:
+            for name in names:
+                if name in converted:
+                    futures[name] = converters.submit(_convert_and_load, *self.sources[name])
+                else:
+                    futures[name] = threads.submit(_load_source, *self.sources[name])
+            for name in names:
+                try:
+                    results[name] = futures[name].result()
+                except Exception as error:
+                    results[name] = error
+
+        entries = {}
+        for name in names:
+            result = results[name]
+            if isinstance(result, Exception):
+                entries[name] = _Entry(None, 1, None, result)
+                self.timings[name] = LoadTiming(name, modes[name], None, result)
+                logger.error('Could not load table %s: %s', name, result)
+            else:
+                df, source, seconds = result
+                self._write_on_load(name, df, source)
+                entries[name] = _Entry(df, 1, source, None)
+                self.timings[name] = LoadTiming(name, modes[name], seconds, None)
+                logger.info('Loaded table %s from %s in %.2fs', name, modes[name], seconds)
+        self._swap(entries)
+
+    def _ensure(self, name):
+        if name not in self._state:
+            with self._load_locks[name]:
+                if name not in self._state:
+                    self._load_all([name])
+
+    # Read-only view of a table, loading it on first use
+    def get(self, name):
+        self._ensure(name)
+        return Snapshot(self._state).get(name)
+
+    def snapshot(self):
+        for name in self.sources:
+            self._ensure(name)
+        return Snapshot(self._state)
+
+    # Load every table now, concurrently, instead of when a panel first asks
+    # for it. Returns the LoadTiming of every table, in TABLES order.
+    def warmup(self):
+        names = list(self.sources)
+        start = time.perf_counter()
+        # Hold every table's lock so sessions wait for this load instead of
+        # starting their own
+        for name in names:
+            self._load_locks[name].acquire()
+        try:
+            pending = [name for name in names if name not in self._state]
+            if pending:
+                self._load_all(pending)
+        finally:
+            for name in names:
+                self._load_locks[name].release()
+        logger.info('Dataset registry warm in %.2fs: %.1f MB',
+                    time.perf_counter() - start, self.memory_usage_total() / 1e6)
+        return [self.timings[name] for name in names if name in self.timings]
+
+    def start_warmup(self):
+        thread = threading.Thread(target=self.warmup, name='dataset-warmup', daemon=True)
+        thread.start()
+        return thread
+
+    # Reload the tables whose source file changed, and retry the ones that
+    # failed; returns their names
+    def refresh(self):
+        changed, touched = {}, {}
+        for name, entry in self._state.items():
+            file_path, how = self.sources[name]
+            if not os.path.exists(file_path):
+                # Served from its columnar copy, or still missing
+                continue
+            try:
+                current = data_store.fingerprint(file_path, entry.source)
+                unchanged = entry.source is not None and current['sha256'] == entry.source['sha256']
+                if unchanged and entry.error is None:
+                    if current != entry.source:
+                        touched[name] = entry._replace(source=current)
+                    continue
+                df, source, seconds = _load_source(file_path, how)
+                self._write_on_load(name, df, source)
+                changed[name] = _Entry(df, entry.version + 1, source, None)
+                self.timings[name] = LoadTiming(name, 'refresh', seconds, None)
+            except Exception:
+                # Keep serving the loaded table
+                logger.exception('Could not refresh table %s', name)
+        if changed or touched:
+            self._swap({**touched, **changed})
+        if changed:
+            logger.info('Reloaded tables: %s', ', '.join(changed))
+        return list(changed)
+
+    # Called on every rerun. At most one refresh runs at a time, in the
+    # background, and only after REFRESH_INTERVAL seconds since the last one.
+    def maybe_refresh(self):
+        if time.monotonic() - self._last_check < REFRESH_INTERVAL:
+            return
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        if time.monotonic() - self._last_check < REFRESH_INTERVAL:
+            # Another session just ran it
+            self._refresh_lock.release()
+            return
+        self._last_check = time.monotonic()
+
+        def run():
+            try:
+                self.refresh()
+            finally:
+                self._refresh_lock.release()
+
+        threading.Thread(target=run, name='dataset-refresh', daemon=True).start()
+
+    # Bytes held by every loaded table, strings included
+    def memory_usage(self):
+        return {
+            name: int(entry.df.memory_usage(deep=True).sum())
+            for name, entry in self._state.items() if entry.error is None
+        }
+
+    def memory_usage_total(self):
+        return sum(self.memory_usage().values())
@@ -0,0 +1,214 @@
+##################################
+# Static snapshot of every dashboard view
+#
+# The dashboard only has len(views.YEARS) x len(views.DEPARTMENTS) selections.
+# export() renders all of them offline, from the registry tables and with the
+# functions of views.py, and writes the content of every panel as a
+# gzip-compressed JSON file that any static server or CDN can serve
+# (Content-Type: application/json, Content-Encoding: gzip):
+#
+#   manifest.json                              selections, map levels, source fingerprints and load errors
+#   views/<año>/<departamento>.json.gz         donuts spec, ranking and number of facilities
+#   map/<año>/<departamento>/<nivel>.json.gz   facility map at every level of views.MAP_DETAIL_LEVELS
+#   lineplot/<departamento>.json.gz            monthly IDM lineplot
+#   choropleth/<año>.json.gz                   national IDM map (only with boundary data)
+#
+# Figures are Plotly figure JSON, built under Streamlit's Plotly theme like in
+# the app and stored without the template, which st.plotly_chart adds back;
+# the donuts are a Vega-Lite spec. Files are deterministic (no gzip
+# timestamp) and only rewritten when their bytes change, so re-exporting
+# unchanged data leaves them untouched and a sync to the CDN only moves what
+# changed. A table that fails to load leaves out the files of the panels
+# built from it instead of failing the export.
+#
+# With DASHBOARD_SNAPSHOT set to an export directory, streamlit_app.py
+# runs read-only from it: no table is loaded and a rerun only reads these files.
+#
+#   python snapshot.py                         # export to data/snapshot/
+#   DASHBOARD_SNAPSHOT=data/snapshot streamlit run streamlit_app.py
+import argparse
+import functools
+import gzip
+import json
+import os
+import time
+
+import data_store
+import idm
+import registry
+import spatial
+import views
+#################################
+
+SNAPSHOT_DIR = os.path.join(data_store.DATA_DIR, 'snapshot')
+MANIFEST = 'manifest.json'
+
+
+def artifact_path(root, panel, *key):
+    return os.path.join(root, panel, *map(str, key)) + '.json.gz'
+
+
+# Content of one file, None if it wasn't exported
+def read_artifact(root, panel, *key):
+    try:
+        with gzip.open(artifact_path(root, panel, *key), 'rt', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def read_manifest(root):
+    try:
+        with open(os.path.join(root, MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+# Changes with every export (the manifest is written last), None if there is
+# none. Caches of the files are keyed by it.
+def version(root):
+    try:
+        return os.stat(os.path.join(root, MANIFEST)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+#################################
+# Export
+
+# Serialized the way st.plotly_chart serializes figures
+def _encode(content):
+    from plotly.io.json import to_json_plotly
+
+    return gzip.compress(to_json_plotly(content).encode('utf-8'), mtime=0)
+
+
+# Make Streamlit's theme the default Plotly template, as st.plotly_chart does,
+# so plotly.express picks the same trace colours as in the app
+def _use_streamlit_template():
+    import plotly.io as pio
+    from streamlit.elements.lib.streamlit_plotly_theme import configure_streamlit_plotly_theme
+
+    configure_streamlit_plotly_theme()
+    pio.templates.default = 'streamlit'
+
+
+# Write a file unless it already has these bytes; returns its path
+def _write(path, data):
+    try:
+        with open(path, 'rb') as f:
+            if f.read() == data:
+                return path
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def _figure_json(fig):
+    content = fig.to_plotly_json()
+    content['layout'].pop('template', None)
+    return content
+
+
+# Vega-Lite spec with its Arrow datasets as plain rows
+def _json_spec(spec):
+    return {**spec, 'datasets': {name: table.to_pylist() for name, table in spec['datasets'].items()}}
+
+
+# Render every view of the registry tables into root; returns the number of files
+def export(root=SNAPSHOT_DIR, datasets=None):
+    if datasets is None:
+        datasets = registry.DatasetRegistry()
+    datasets.warmup()
+    data = datasets.snapshot()
+    _use_streamlit_template()
+
+    # A table that failed to load leaves out the panels built from it, as in
+    # the app: the manifest lists the errors and the app shows them per panel
+    errors = {}
+
+    def build(structure, builder):
+        try:
+            return builder()
+        except registry.TableLoadError as error:
+            errors[structure] = str(error)
+            return None
+
+    # Facilities from the registry table, so every file matches the same version
+    facility_store = build('geo', lambda: idm.FacilityStore(data.get('geo_idm')))
+    idm_index = build('idm', lambda: views.build_idm_index(data))
+    series_store = build('series', lambda: views.build_series_store(data))
+    ranking_store = build('ranking', lambda: idm.RankingStore(data.get('ranking_ranks')))
+    # Offline, so the boundaries can be built here, unlike in the app
+    if os.path.exists(data_store.BOUNDARY_FILE) and not data_store.is_fresh(data_store.BOUNDARY_FILE,
+                                                                             data_store.BOUNDARIES_DIR):
+        data_store.build_department_boundaries()
+    boundaries = data_store.read_department_boundaries(views.CHOROPLETH_TOLERANCE)
+
+    written = set()
+
+    def write(content, panel, *key):
+        written.add(_write(artifact_path(root, panel, *key), _encode(content)))
+
+    for year in views.YEARS:
+        choropleth = views.choropleth_figure(boundaries, idm_index, year) if idm_index is not None else None
+        if choropleth is not None:
+            write(_figure_json(choropleth), 'choropleth', year)
+
+        for depart in views.DEPARTMENTS:
+            partition = (facility_store.selection(year, depart)[data_store.GEO_COLUMNS].reset_index(drop=True)
+                         if facility_store is not None else None)
+            values = views.idm_values(idm_index, year, depart) if idm_index is not None else (None,)
+            write({
+                'donuts': _json_spec(views.donuts_spec(values, depart)) if None not in values else None,
+                'ranking': (views.top_shortages(ranking_store, depart, year)['nombre_med_grupo'].tolist()
+                            if ranking_store is not None else None),
+                'facilities': len(partition) if partition is not None else 0,
+            }, 'views', year, depart)
+
+            if partition is not None and not partition.empty:
+                get_lod = functools.lru_cache(maxsize=None)(functools.partial(spatial.build_lod, partition))
+                for level, zoom in views.MAP_DETAIL_LEVELS.items():
+                    write(_figure_json(views.map_figure(partition, zoom, get_lod)), 'map', year, depart, level)
+
+    if series_store is not None:
+        for depart in views.DEPARTMENTS:
+            write(_figure_json(views.lineplot_figure(series_store.depart(depart))), 'lineplot', depart)
+
+    # Files of an earlier export that this one didn't produce
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            if filename.endswith('.json.gz') and path not in written:
+                os.remove(path)
+
+    sources = {name: file_path for name, (file_path, _) in datasets.sources.items()}
+    sources['boundaries'] = data_store.BOUNDARY_FILE
+    manifest = {
+        'years': views.YEARS,
+        'departments': views.DEPARTMENTS,
+        'map_detail_levels': views.MAP_DETAIL_LEVELS,
+        'sources': {name: data_store.fingerprint(file_path)['sha256']
+                    for name, file_path in sources.items() if os.path.exists(file_path)},
+        'files': len(written),
+        'errors': errors,
+    }
+    # Always replaced, so version() changes with every export
+    with open(os.path.join(root, MANIFEST + '.tmp'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(os.path.join(root, MANIFEST + '.tmp'), os.path.join(root, MANIFEST))
+    return len(written)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Render every dashboard view to static JSON files.')
+    parser.add_argument('--output', default=SNAPSHOT_DIR, help='directory for the exported files')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    files = export(args.output)
+    print(f'{files} files in {args.output}/ ({time.perf_counter() - start:.2f}s)')
@@ -0,0 +1,154 @@
+##################################
+# Level of detail for the facility map
+#
+# Below POINTS_MIN_ZOOM the map doesn't draw every facility: the facilities of
+# a selection are aggregated on a grid whose cells cover about CLUSTER_PIXELS
+# on screen at that zoom, and each cell is drawn as one marker. The grids of
+# every zoom in CLUSTER_ZOOMS are built together, once per (año, departamento).
+import numpy as np
+import pandas as pd
+#################################
+
+# Zoom levels with a precomputed grid, from the whole department to districts
+CLUSTER_ZOOMS = (6.5, 8, 9.5)
+# From this zoom on every facility is drawn
+POINTS_MIN_ZOOM = 11
+# Selections with fewer facilities are always drawn point by point
+LOD_MIN_FACILITIES = 300
+# Width of a grid cell on screen
+CLUSTER_PIXELS = 60
+
+CLUSTER_COLUMNS = ['latitud', 'longitud', 'establecimientos', 'dispo']
+
+
+# Degrees covered by CLUSTER_PIXELS at a web mercator zoom level (256 px tiles)
+def cell_size(zoom):
+    return CLUSTER_PIXELS * 360 / (256 * 2 ** zoom)
+
+
+# One row per occupied grid cell: mean position, number of facilities and mean
+# dispo. Cells are anchored at (0, 0), so the same facilities always give the
+# same clusters.
+def cluster_facilities(df, zoom):
+    if df.empty:
+        return pd.DataFrame(columns=CLUSTER_COLUMNS)
+    size = cell_size(zoom)
+    cells = pd.DataFrame({
+        'fila': np.floor(df['latitud'].to_numpy(dtype='float64') / size).astype('int32'),
+        'columna': np.floor(df['longitud'].to_numpy(dtype='float64') / size).astype('int32'),
+        'latitud': df['latitud'].to_numpy(),
+        'longitud': df['longitud'].to_numpy(),
+        'dispo': df['dispo'].to_numpy(dtype='float32'),
+    })
+    clusters = cells.groupby(['fila', 'columna'], sort=True).agg(
+        latitud=('latitud', 'mean'),
+        longitud=('longitud', 'mean'),
+        establecimientos=('dispo', 'size'),
+        dispo=('dispo', 'mean'),
+    )
+    return clusters.reset_index(drop=True)[CLUSTER_COLUMNS]
+
+
+# zoom -> clusters for every zoom in CLUSTER_ZOOMS
+def build_lod(df):
+    return {zoom: cluster_facilities(df, zoom) for zoom in CLUSTER_ZOOMS}
+
+
+# Whether the map of this selection is drawn point by point at this zoom
+def draws_points(df, zoom):
+    return zoom >= POINTS_MIN_ZOOM or len(df) < LOD_MIN_FACILITIES
+
+
+
+#################################
+# Spatial index for viewport and radius queries
+#
+# Facilities are bucketed in a regular lat/lon grid, per year, and sorted by
+# (año, cell). The facilities of one cell are a contiguous row range found
+# with a binary search, so a query only looks at the cells it overlaps instead
+# of scanning every row.
+
+# Side of a grid cell in degrees (about 11 km)
+INDEX_CELL_DEGREES = 0.1
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+
+
+def haversine_km(lat, lon, lats, lons):
+    lat, lon, lats, lons = map(np.radians, (lat, lon, lats, lons))
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+class FacilityIndex:
+    def __init__(self, facilities, cell_degrees=INDEX_CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        lats = facilities['latitud'].to_numpy(dtype='float64')
+        lons = facilities['longitud'].to_numpy(dtype='float64')
+        years = facilities['año'].to_numpy(dtype='int64')
+        self.lat_origin = lats.min() if len(lats) else 0.0
+        self.lon_origin = lons.min() if len(lons) else 0.0
+        self.year_origin = years.min() if len(years) else 0
+        self.rows = int(np.floor((lats.max() - self.lat_origin) / cell_degrees)) + 1 if len(lats) else 1
+        self.cols = int(np.floor((lons.max() - self.lon_origin) / cell_degrees)) + 1 if len(lons) else 1
+
+        keys = self._keys(years, self._row(lats), self._col(lons))
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.data = facilities.iloc[order].reset_index(drop=True)
+        self.lats = lats[order]
+        self.lons = lons[order]
+
+    def _row(self, lats):
+        return np.floor((lats - self.lat_origin) / self.cell_degrees).astype('int64')
+
+    def _col(self, lons):
+        return np.floor((lons - self.lon_origin) / self.cell_degrees).astype('int64')
+
+    def _keys(self, years, rows, cols):
+        return ((years - self.year_origin) * self.rows + rows) * self.cols + cols
+
+    # Positions of the facilities of one year in the cells overlapping a box
+    def _candidates(self, year, lat_min, lat_max, lon_min, lon_max):
+        row_min, row_max = np.clip(self._row(np.array([lat_min, lat_max])), 0, self.rows - 1)
+        col_min, col_max = np.clip(self._col(np.array([lon_min, lon_max])), 0, self.cols - 1)
+        years = np.full(row_max - row_min + 1, year, dtype='int64')
+        grid_rows = np.arange(row_min, row_max + 1)
+        # One contiguous key range per grid row
+        starts = np.searchsorted(self.keys, self._keys(years, grid_rows, col_min), side='left')
+        stops = np.searchsorted(self.keys, self._keys(years, grid_rows, col_max), side='right')
+        if not len(starts):
+            return np.empty(0, dtype='int64')
+        return np.concatenate([np.arange(start, stop) for start, stop in zip(starts, stops)])
+
+    # Facilities of one year inside a lat/lon box
+    def viewport(self, year, lat_min, lat_max, lon_min, lon_max):
+        positions = self._candidates(year, lat_min, lat_max, lon_min, lon_max)
+        lats, lons = self.lats[positions], self.lons[positions]
+        inside = (lats >= lat_min) & (lats <= lat_max) & (lons >= lon_min) & (lons <= lon_max)
+        return self.data.iloc[positions[inside]]
+
+    # Facilities of one year within km of a point, nearest first, with their
+    # distance in a distancia_km column
+    def within(self, year, lat, lon, km):
+        lat_delta = km / KM_PER_DEGREE
+        lon_delta = km / (KM_PER_DEGREE * max(np.cos(np.radians(lat)), 1e-6))
+        positions = self._candidates(year, lat - lat_delta, lat + lat_delta, lon - lon_delta, lon + lon_delta)
+        distances = haversine_km(lat, lon, self.lats[positions], self.lons[positions])
+        inside = distances <= km
+        order = np.argsort(distances[inside], kind='stable')
+        return self.data.iloc[positions[inside][order]].assign(distancia_km=distances[inside][order])
+
+
+# Lat/lon box shown by a map of width x height pixels centered on a point
+def viewport_bounds(lat, lon, zoom, width=800, height=500):
+    degrees_per_pixel = 360 / (256 * 2 ** zoom)
+    lon_half = width / 2 * degrees_per_pixel
+    # Mercator: a pixel spans fewer degrees of latitude away from the equator
+    lat_half = height / 2 * degrees_per_pixel * np.cos(np.radians(lat))
+    return lat - lat_half, lat + lat_half, lon - lon_half, lon + lon_half
+
+
+# Zoom at which a circle of km around the center fits in pixels of map height
+def zoom_for_radius(km, pixels=500):
+    return float(np.log2(pixels * 2 * np.pi * EARTH_RADIUS_KM / (256 * 2 * km)))
@@ -1,18 +1,28 @@
 ##################################
 # Import libraries 
-import openpyxl
+# Only what the first render needs. plotly.express is imported by the loader
+# that uses it; benchmarks/import_profile.py checks the import budget.
+import logging
+import os
 import streamlit as st 
 import pandas as pd 
-import geopandas as gpd
-import folium
-from streamlit_folium import st_folium
-import altair as alt
-import matplotlib.pyplot as plt
-import plotly.graph_objects as go
-import plotly.express as px
-from streamlit_navigation_bar import st_navbar
+import charts
+import data_store
+import idm
+import perf
+import registry
+import spatial
+import validation
+import views
 #################################
 
+logger = logging.getLogger(__name__)
+
+# Export directory of snapshot.py to serve from instead of the tables
+SNAPSHOT_ENV = 'DASHBOARD_SNAPSHOT'
+# Port to serve the JSON API of api.py on
+API_PORT_ENV = 'DASHBOARD_API_PORT'
+
 st.set_page_config(
     page_title='Disponibilidad de medicamentos en establecimientos de salud Peru',
     page_icon="💊",
@@ -22,21 +32,160 @@ st.set_page_config(
 
 #################################
 # Cache the loading of data to improve performance
-@st.cache_data
-def load_data(file_path, columns=None):
-    return pd.read_excel(file_path, usecols=columns)
+# Every table is loaded once per server process into a registry shared by all
+# sessions (Parquet copy from build_data.py when there is one). Loading starts
+# in the background as soon as the first session connects, and tables whose
+# workbook changes are reloaded without a restart.
+# With DASHBOARD_API_PORT set, the same registry also answers the JSON API (api.py).
+@st.cache_resource
+def get_registry():
+    datasets = registry.DatasetRegistry()
+    datasets.start_warmup()
+    # The query API (api.py) is only imported when it is served
+    port = os.environ.get(API_PORT_ENV)
+    if port:
+        import api
+
+        port = int(port)
+        try:
+            api.start_server(datasets, port)
+        except OSError:
+            logger.exception('Could not start the query API on port %d', port)
+    return datasets
+
+# The structures below are built from registry tables. Their caches are keyed
+# by the versions of those tables (the _data snapshot itself isn't hashed), so
+# a refreshed table builds new ones and the old entries are evicted.
+# perf.cached counts the hits and misses of every cache for the diagnostics panel.
+
+# Facilities of one (año, departamento), read from its partition on demand.
+# max_entries bounds how many partitions stay in memory; the least recently
+# used one is evicted first.
+GEO_PARTITIONS_IN_MEMORY = 32
+
+@perf.cached(st.cache_resource(max_entries=GEO_PARTITIONS_IN_MEMORY))
+def load_geo_partition(_data, year, depart, version):
+    source = _data.source('geo_idm')
+    partition = data_store.read_geo_partition(year, depart, source['sha256'] if source else None)
+    if partition is None:
+        # The registry already wrote the partitions of a newer workbook: take
+        # the rows of this version from its table
+        facilities = _data.get('geo_idm')
+        rows = facilities[(facilities['año'] == year) & (facilities['departamento'] == depart)]
+        partition = rows[data_store.GEO_COLUMNS].reset_index(drop=True).apply(
+            lambda col: col.cat.remove_unused_categories() if col.dtype == 'category' else col)
+    return partition
+
+# Grid clusters of one (año, departamento) at every zoom in spatial.CLUSTER_ZOOMS
+@perf.cached(st.cache_resource(max_entries=GEO_PARTITIONS_IN_MEMORY))
+def load_map_lod(_data, year, depart, version):
+    return spatial.build_lod(load_geo_partition(_data, year, depart, version))
+
+# Facility map figure for one (año, departamento) and zoom, shared by every
+# session. Large selections send one marker per cluster until the zoom reaches
+# spatial.POINTS_MIN_ZOOM. Only the MAP_FIGURES_IN_MEMORY most recently used
+# figures are kept.
+MAP_FIGURES_IN_MEMORY = 64
+
+@perf.cached(st.cache_resource(max_entries=MAP_FIGURES_IN_MEMORY))
+def load_map_figure(_data, year, depart, version, zoom):
+    return views.map_figure(load_geo_partition(_data, year, depart, version), zoom,
+                            lambda: load_map_lod(_data, year, depart, version))
+
+# Data-quality report of the facility table, checked once per version
+@perf.cached(st.cache_resource(max_entries=2))
+def load_geo_report(_data, version):
+    report = validation.validate_facilities(_data.get('geo_idm'))
+    for warning in report.warnings:
+        logger.warning('geo_idm: %s', warning)
+    return report
+
+# Spatial index over every facility, for radius and viewport queries
+@perf.cached(st.cache_resource(max_entries=2))
+def load_facility_index(_data, version):
+    return spatial.FacilityIndex(_data.get('geo_idm'))
+
+# Map of the facilities within km of a facility of the selection, nearest first
+@perf.cached(st.cache_resource(max_entries=MAP_FIGURES_IN_MEMORY))
+def load_radius_figure(_data, year, depart, position, km, version):
+    reference = load_geo_partition(_data, year, depart, version).iloc[position]
+    nearby = load_facility_index(_data, version).within(year, reference['latitud'], reference['longitud'], km)
+    return charts.build_map_figure(nearby, spatial.zoom_for_radius(km))
+
+# Department boundaries simplified at one of data_store.BOUNDARY_TOLERANCES,
+# per build (data_store.boundaries_version), so boundaries built while the
+# server runs are picked up
+@perf.cached(st.cache_resource(max_entries=len(data_store.BOUNDARY_TOLERANCES)))
+def load_boundaries(tolerance, boundaries_version):
+    return data_store.read_department_boundaries(tolerance)
+
+# National IDM map of one year, None without boundary data
+@perf.cached(st.cache_resource(max_entries=MAP_FIGURES_IN_MEMORY))
+def load_choropleth_figure(_idm_index, year, tolerance, version, boundaries_version):
+    return views.choropleth_figure(load_boundaries(tolerance, boundaries_version), _idm_index, year)
+
+# Index of the annual IDM by (año, departamento), built once per version
+@perf.cached(st.cache_resource(max_entries=2))
+def load_idm_index(_data, version):
+    return views.build_idm_index(_data)
+
+# Monthly IDM series of the three establishment types, in one sorted table
+@perf.cached(st.cache_resource(max_entries=2))
+def load_series_store(_data, version):
+    return views.build_series_store(_data)
+
+# Monthly IDM lineplot of one department
+@perf.cached(st.cache_resource(max_entries=32))
+def load_lineplot_figure(_idm_series, depart, version):
+    return views.lineplot_figure(_idm_series.depart(depart))
+
+# Medicines in shortage ranked per (departamento, año), aggregated offline
+@perf.cached(st.cache_resource(max_entries=2))
+def load_ranking_store(_data, version):
+    return idm.RankingStore(_data.get('ranking_ranks'))
 
 # Load data
-filtros = load_data('data/sidebar.xlsx')
-idm_anual_data = load_data('data/IDM_anual.xlsx')
-idm_anual_hosp = load_data('data/IDM_anual_hospitales.xlsx')
-idm_anual_cen = load_data('data/IDM_anual_centros.xlsx')
-idm_anual_pue = load_data('data/IDM_anual_puestos.xlsx')
-geo_idm = load_data('data/geo_idm_anual.xlsx')
-idm_hospitales = load_data('data/data_lineplot_hosp.xlsx')
-idm_centros = load_data('data/data_lineplot_centros.xlsx')
-idm_puestos = load_data('data/data_lineplot_puestos.xlsx')
-ranking = load_data('data/ranking_medicamentos_desabastecidos.xlsx', columns=['departamento', 'año', 'nombre_med_grupo'])
+# One snapshot per rerun: a refresh that lands mid-rerun is picked up by the next one
+# In snapshot mode (snapshot.py) nothing is loaded: every panel is read from
+# the exported files. snapshot is only imported then.
+snapshot_root = os.environ.get(SNAPSHOT_ENV) or None
+if snapshot_root is not None:
+    import snapshot
+
+# A table that failed to load (registry.TableLoadError) only leaves out the
+# panels built from it: load() keeps the error and returns None, and those
+# panels show it with panel_error() while the others are drawn
+load_errors = {}
+
+def load(structure, loader, *args):
+    try:
+        return loader(*args)
+    except registry.TableLoadError as error:
+        # Already logged by the registry when the table failed
+        load_errors[structure] = error
+        return None
+
+
+def panel_error(structure):
+    st.error(f'No se pudieron cargar los datos de este panel: {load_errors[structure]}')
+
+
+perf.start_run()
+with perf.section('load'):
+    if snapshot_root is not None:
+        snapshot_version = snapshot.version(snapshot_root)
+    else:
+        datasets = get_registry()
+        datasets.maybe_refresh()
+        data = datasets.snapshot()
+
+        geo_version = data.version('geo_idm')
+        geo_report = load('geo', load_geo_report, data, geo_version)
+        ranking_store = load('ranking', load_ranking_store, data, data.version('ranking_ranks'))
+        idm_version = data.version(*views.IDM_TABLES)
+        idm_index = load('idm', load_idm_index, data, idm_version)
+        series_version = data.version(*views.SERIES_TABLES)
+        idm_series = load('series', load_series_store, data, series_version)
 
 ################################
 # Sidebar
@@ -59,210 +208,284 @@ with st.container():
     #col3, col4 = st.columns([3, 7])
     
     with col3:
-        year_list = [2019, 2020, 2021, 2022, 2023, 2024]
+        year_list = views.YEARS
         selected_year = st.selectbox('Selecciona un año', year_list, index=len(year_list)-1)
     
     with col3:
-        depart_list = sorted([
-            'AMAZONAS', 'CAJAMARCA', 'AREQUIPA', 'AYACUCHO', 'APURIMAC',
-            'ANCASH', 'HUANUCO', 'ICA', 'HUANCAVELICA', 'CUSCO', 'CALLAO',
-            'UCAYALI', 'TUMBES', 'SANMARTIN', 'TACNA', 'PUNO', 'PIURA',
-            'PASCO', 'LORETO', 'MOQUEGUA', 'MADREDEDIOS', 'LIMA', 'LALIBERTAD',
-            'JUNIN', 'LAMBAYEQUE'
-        ])
+        depart_list = views.DEPARTMENTS
         selected_depart = st.selectbox('Selecciona el departamento', depart_list)
     st.markdown("<hr style='border:1px solid #ccc;' />", unsafe_allow_html=True)
 
 
 #################################
 
-# Donut chart
-def assign_color(idm_value):
-    if idm_value >= 90:
-        return ['#27AE60', '#12783D']  # Verde
-    elif idm_value >= 70:
-        return ['#F39C12', '#875A12']  # Amarillo
-    elif idm_value >= 50:
-        return ['#E67E22', '#B35418']  # Naranja
-    else:
-        return ['#E74C3C', '#781F16']  # Rojo
+# Draw the four IDM donuts as one chart with a shared dataset (one element and
+# one dataset sent per rerun) instead of four separate charts
+DONUTS_AS_ONE_CHART = True
 
-def make_donut(idm_value, departamento):
-    chart_color = assign_color(idm_value)
-    
-    idm_value_int = int(round(idm_value))
-    source = pd.DataFrame({
-        "Topic": ['', departamento],
-        "% value": [100 - idm_value, idm_value]
-    })
-    source_bg = pd.DataFrame({
-        "Topic": ['', departamento],
-        "% value": [100, 0]
-    })
-    
-    plot = alt.Chart(source).mark_arc(innerRadius=45, cornerRadius=25).encode(
-        theta=alt.Theta("% value", type="quantitative"),
-        color=alt.Color("Topic:N",
-                        scale=alt.Scale(
-                            domain=[departamento, ''],
-                            range=chart_color),
-                        legend=None),
-    ).properties(width=130, height=130)
-    
-    text = plot.mark_text(align='center', color=chart_color[0], font="serif", fontSize=30, fontWeight=700, fontStyle="normal").encode(
-        text=alt.value(f'{idm_value_int}%')
-    )
-    
-    plot_bg = alt.Chart(source_bg).mark_arc(innerRadius=45, cornerRadius=20).encode(
-        theta=alt.Theta("% value", type="quantitative"),
-        color=alt.Color("Topic:N",
-                        scale=alt.Scale(
-                            domain=[departamento, ''],
-                            range=chart_color),
-                        legend=None),
-    ).properties(width=130, height=130)
-    
-    return plot_bg + plot + text
 # Calculation IDM by year and department
-@st.cache_data
-def calculate_idm_by_depart_year(input_df, input_year, input_depart):
-    selected_IDM_depart_year = input_df[(input_df['departamento'] == input_depart) & (input_df['año'] == input_year)]['IDM'].round(0).values
-    if len(selected_IDM_depart_year) > 0:
-        return selected_IDM_depart_year[0]
-    else:
-        return None
+# Returns the IDM (total, hospitales, centros, puestos) in a single dict probe.
+# Selections without annual IDM are counted for the diagnostics panel.
+def calculate_idm_by_depart_year(idm_index, input_year, input_depart):
+    if (input_year, input_depart) not in idm_index:
+        perf.METRICS.event('selecciones_sin_idm_anual')
+    return views.idm_values(idm_index, input_year, input_depart)
 ###################################
+# Panels
+# Each panel is a fragment that gets everything it depends on as arguments.
+# A change to a panel's own widgets (the map's detail level and distance
+# search) reruns only that panel. Changing año or departamento reruns the
+# script, and a panel whose arguments didn't change reuses its cached chart:
+# the lineplot only depends on the department and the national map only on
+# the year.
 
-col = st.columns((1.5, 4, 2.5), gap='medium')
+@st.fragment
+def donuts_panel(idm_index, year, depart):
+    with perf.section('donuts'):
+        st.markdown('#### IDM Anual Departamental')
+        
+        IDM_anual, IDM_anual_hosp, IDM_anual_cen, IDM_anual_pue = calculate_idm_by_depart_year(
+            idm_index, year, depart)
 
-if 'latitud' not in geo_idm.columns or 'longitud' not in geo_idm.columns:
-    st.error("Las columnas 'latitud' y 'longitud' no existen en el DataFrame.")
-else:
-    if geo_idm[['latitud', 'longitud']].isnull().any().any():
-        st.error("Hay valores nulos en las columnas 'latitud' y 'longitud'.")
-    else:
-        ####################################
-        # Dashboard Main Panel
-        col = st.columns((1.5, 4.5, 2), gap='medium')
+        # Same as the snapshot export: no donuts for a selection without annual IDM
+        if None in (IDM_anual, IDM_anual_hosp, IDM_anual_cen, IDM_anual_pue):
+            return
 
-        with col[0]:
-            st.markdown('#### IDM Anual Departamental')
-            
-            IDM_anual = calculate_idm_by_depart_year(idm_anual_data, selected_year, selected_depart)
-            IDM_anual_hosp = calculate_idm_by_depart_year(idm_anual_hosp, selected_year, selected_depart)
-            IDM_anual_cen = calculate_idm_by_depart_year(idm_anual_cen, selected_year, selected_depart)
-            IDM_anual_pue = calculate_idm_by_depart_year(idm_anual_pue, selected_year, selected_depart)
-
-            idm_donut_total_chart = make_donut(IDM_anual, selected_depart)
-            idm_donut_hosp_chart = make_donut(IDM_anual_hosp, selected_depart)
-            idm_donut_cen_chart = make_donut(IDM_anual_cen, selected_depart)
-            idm_donut_pue_chart = make_donut(IDM_anual_pue, selected_depart)
-            
+        if DONUTS_AS_ONE_CHART:
+            st.vega_lite_chart(views.donuts_spec(
+                (IDM_anual, IDM_anual_hosp, IDM_anual_cen, IDM_anual_pue), depart), use_container_width=True)
+        else:
+            idm_donut_total_chart = charts.make_donut(IDM_anual, depart)
+            idm_donut_hosp_chart = charts.make_donut(IDM_anual_hosp, depart)
+            idm_donut_cen_chart = charts.make_donut(IDM_anual_cen, depart)
+            idm_donut_pue_chart = charts.make_donut(IDM_anual_pue, depart)
+        
             st.write('IDM Anual')
-            st.altair_chart(idm_donut_total_chart, use_container_width=True)
-            
+            st.vega_lite_chart(idm_donut_total_chart, use_container_width=True)
+        
             st.write('IDM Anual - Hospitales')
-            st.altair_chart(idm_donut_hosp_chart, use_container_width=True)
-            
+            st.vega_lite_chart(idm_donut_hosp_chart, use_container_width=True)
+        
             st.write('IDM Anual - Centros de Salud')
-            st.altair_chart(idm_donut_cen_chart, use_container_width=True)
-            
+            st.vega_lite_chart(idm_donut_cen_chart, use_container_width=True)
+        
             st.write('IDM Anual - Puestos de Salud')
-            st.altair_chart(idm_donut_pue_chart, use_container_width=True)
+            st.vega_lite_chart(idm_donut_pue_chart, use_container_width=True)
 
-        with col[1]:
-            # Filtrar datos según el año y el departamento seleccionados
-            filtered_data = geo_idm[(geo_idm['año'] == selected_year) & (geo_idm['departamento'] == selected_depart)]
-        
-            # Verificar si hay datos para el departamento seleccionado
-            if not filtered_data.empty:
-                # Obtener la primera coordenada del dataframe filtrado
-                initial_lat = filtered_data.iloc[0]['latitud']
-                initial_lon = filtered_data.iloc[0]['longitud']
-        
-                # Crear el mapa de Plotly
-                fig = go.Figure()
-        
-                for tipo in ['Hospital', 'Centro de salud', 'Puesto de Salud', 'Otro']:
-                    df_tipo = filtered_data[filtered_data['tipo'] == tipo]
-                    fig.add_trace(go.Scattermapbox(
-                        lat=df_tipo['latitud'],
-                        lon=df_tipo['longitud'],
-                        mode='markers',
-                        marker=go.scattermapbox.Marker(size=9),
-                        text=df_tipo.apply(lambda row: f"Nombre: {row['establec']}<br>IDM: {row['dispo']}%<br>Tipo: {row['tipo']}", axis=1),  # Popup content
-                        hoverinfo='text',
-                        name=tipo
-                    ))
-        
-                fig.update_layout(
-                    mapbox_style="carto-positron",
-                    mapbox=dict(
-                        center=go.layout.mapbox.Center(
-                            lat=initial_lat,
-                            lon=initial_lon
-                        ),
-                        zoom=6.5
-                    ),
-                    margin={"r":0,"t":0,"l":0,"b":0},
-                    legend_title_text='Tipo de Establecimiento',
-            legend=dict(
-                orientation="h",
-                yanchor="top",
-                y=-0.05,  # Ajusta la posición vertical de la leyenda
-                xanchor="center",
-                x=0.5
-                ))
-        
-                st.markdown('### Mapa de Disponibilidad de medicinas por establecimiento de salud')
+
+@st.fragment
+def map_panel(data, year, depart, geo_version):
+    with perf.section('map'):
+        # Mapa de Plotly del año y departamento seleccionados, reutilizado
+        # si la selección ya se dibujó
+        selected_detail = st.select_slider('Nivel de detalle del mapa', options=list(views.MAP_DETAIL_LEVELS))
+
+        # Búsqueda por distancia: solo se envían los establecimientos dentro del radio
+        with st.expander('Establecimientos cercanos'):
+            names = load_geo_partition(data, year, depart, geo_version)['establec'].tolist()
+            selected_reference = st.selectbox(
+                'Establecimiento de referencia', range(len(names)), index=None,
+                format_func=names.__getitem__,
+                placeholder='Ninguno')
+            selected_radius = st.slider('Radio (km)', 1, 100, 10)
+
+        with perf.section('map.figure'):
+            if selected_reference is not None:
+                fig = load_radius_figure(data, year, depart, selected_reference, selected_radius, geo_version)
+            else:
+                fig = load_map_figure(data, year, depart, geo_version, views.MAP_DETAIL_LEVELS[selected_detail])
+    
+        if fig is not None:
+            st.markdown('### Mapa de Disponibilidad de medicinas por establecimiento de salud')
+            # Serialización de la figura
+            with perf.section('map.render'):
                 st.plotly_chart(fig, use_container_width=True)
-                
-        ########## LINEPLOT
-                st.markdown('### Evolución del IDM por tipo de establecimiento')
-                df_lineplot = pd.concat([
-                    idm_hospitales[idm_hospitales['departamento'] == selected_depart].assign(tipo='Hospitales'),
-                    idm_centros[idm_centros['departamento'] == selected_depart].assign(tipo='Centros de Salud'),
-                    idm_puestos[idm_puestos['departamento'] == selected_depart].assign(tipo='Puestos de Salud')
-                ])
-                
-                # Crear el line plot usando plotly
-                fig = px.line(
-                    df_lineplot,
-                    x="date", y="idm",
-                    color="tipo",
-                    labels={"idm": "IDM", "date": "Fecha"}
-                )
-        
-                # Añadir las líneas horizontales de colores
-                fig.add_hrect(y0=90, y1=100, line_width=0, fillcolor="green", opacity=0.2, annotation_text="Bien", annotation_position="top left")
-                fig.add_hrect(y0=70, y1=90, line_width=0, fillcolor="yellow", opacity=0.2, annotation_text="Regular", annotation_position="top left")
-                fig.add_hrect(y0=50, y1=70, line_width=0, fillcolor="orange", opacity=0.2, annotation_text="Mal", annotation_position="top left")
-                fig.add_hrect(y0=35, y1=50, line_width=0, fillcolor="red", opacity=0.2, annotation_text="Muy mal", annotation_position="top left")
-        
-                # Mover la leyenda a la parte inferior
-                fig.update_layout(
-                    legend_title_text='Tipo de Establecimiento',
-                    legend=dict(
-                        orientation="h",
-                        yanchor="top",
-                        y=-0.2,  # Ajusta la posición vertical de la leyenda
-                        xanchor="center",
-                        x=0.5
-                    )
-                )
+
+
+@st.fragment
+def lineplot_panel(idm_series, depart, series_version):
+    with perf.section('lineplot'):
+        st.markdown('### Evolución del IDM por tipo de establecimiento')
+        fig = load_lineplot_figure(idm_series, depart, series_version)
+        with perf.section('lineplot.render'):
+            st.plotly_chart(fig, use_container_width=True)
+
+
+@st.fragment
+def choropleth_panel(idm_index, year, idm_version):
+    with perf.section('choropleth'):
+        fig = load_choropleth_figure(idm_index, year, views.CHOROPLETH_TOLERANCE, idm_version,
+                                     data_store.boundaries_version())
+        if fig is not None:
+            st.markdown('### IDM Anual por departamento')
+            st.plotly_chart(fig, use_container_width=True)
+
+
+@st.fragment
+def ranking_panel(ranking_store, depart, year):
+    with perf.section('ranking'):
+        top_ranking = views.top_shortages(ranking_store, depart, year)
+
+        st.markdown('### Top Medicamentos desabastecidos')
         
+        st.dataframe(top_ranking,
+                     hide_index=True,
+                     width=None,
+                     column_config={
+                         'nombre_med_grupo': st.column_config.TextColumn('nombre_med_grupo')
+                     })
+
+
+###################################
+# Snapshot mode: the same panels, drawn from the exported files. The files
+# are cached per export, so a rerun does no data work at all.
+SNAPSHOT_FILES_IN_MEMORY = 256
+
+@perf.cached(st.cache_resource(max_entries=SNAPSHOT_FILES_IN_MEMORY))
+def load_snapshot_artifact(root, version, panel, *key):
+    return snapshot.read_artifact(root, panel, *key)
+
+@perf.cached(st.cache_resource(max_entries=2))
+def load_snapshot_manifest(root, version):
+    return snapshot.read_manifest(root)
+
+
+@st.fragment
+def snapshot_map_panel(root, version, year, depart):
+    with perf.section('map'):
+        selected_detail = st.select_slider('Nivel de detalle del mapa', options=list(views.MAP_DETAIL_LEVELS))
+        st.markdown('### Mapa de Disponibilidad de medicinas por establecimiento de salud')
+        with perf.section('map.render'):
+            st.plotly_chart(load_snapshot_artifact(root, version, 'map', year, depart, selected_detail),
+                            use_container_width=True)
+
+
+def snapshot_panels(root, version, year, depart):
+    view = load_snapshot_artifact(root, version, 'views', year, depart) if version is not None else None
+    if view is None:
+        st.error(f'No hay datos exportados para {depart} {year} en {root}.')
+        return
+    # Tables that failed to load in the export, shown like in the live app
+    load_errors.update(load_snapshot_manifest(root, version).get('errors', {}))
+
+    col = st.columns((1.5, 4.5, 2), gap='medium')
+
+    with col[0], perf.section('donuts'):
+        st.markdown('#### IDM Anual Departamental')
+        if 'idm' in load_errors:
+            panel_error('idm')
+        elif view['donuts'] is not None:
+            st.vega_lite_chart(view['donuts'], use_container_width=True)
+
+    with col[1]:
+        if 'geo' in load_errors:
+            panel_error('geo')
+        elif view['facilities']:
+            snapshot_map_panel(root, version, year, depart)
+            with perf.section('lineplot'):
+                if 'series' in load_errors:
+                    panel_error('series')
+                else:
+                    st.markdown('### Evolución del IDM por tipo de establecimiento')
+                    st.plotly_chart(load_snapshot_artifact(root, version, 'lineplot', depart),
+                                    use_container_width=True)
+
+        with perf.section('choropleth'):
+            fig = load_snapshot_artifact(root, version, 'choropleth', year)
+            if fig is not None:
+                st.markdown('### IDM Anual por departamento')
                 st.plotly_chart(fig, use_container_width=True)
 
+    with col[2], perf.section('ranking'):
+        if 'ranking' in load_errors:
+            panel_error('ranking')
+        else:
+            st.markdown('### Top Medicamentos desabastecidos')
+            st.dataframe({'nombre_med_grupo': view['ranking']},
+                         hide_index=True,
+                         width=None,
+                         column_config={
+                             'nombre_med_grupo': st.column_config.TextColumn('nombre_med_grupo')
+                         })
+
+###################################
+
+if snapshot_root is not None:
+    snapshot_panels(snapshot_root, snapshot_version, selected_year, selected_depart)
+else:
+    col = st.columns((1.5, 4, 2.5), gap='medium')
+
+    # Validated once per version of the facility table (validation.py)
+    if geo_report is not None and not geo_report.ok:
+        for error in geo_report.errors:
+            st.error(error)
+    else:
+        ####################################
+        # Dashboard Main Panel
+        col = st.columns((1.5, 4.5, 2), gap='medium')
+
+        with col[0]:
+            if idm_index is None:
+                panel_error('idm')
+            else:
+                donuts_panel(idm_index, selected_year, selected_depart)
+
+        with col[1]:
+            if geo_report is None:
+                panel_error('geo')
+            else:
+                map_panel(data, selected_year, selected_depart, geo_version)
+
+                # Verificar si hay datos para el departamento seleccionado
+                if not load_geo_partition(data, selected_year, selected_depart, geo_version).empty:
+                    if idm_series is None:
+                        panel_error('series')
+                    else:
+                        lineplot_panel(idm_series, selected_depart, series_version)
+
+            # The donuts already report a missing annual IDM
+            if idm_index is not None:
+                choropleth_panel(idm_index, selected_year, idm_version)
+
+    #######################################
+
+    with col[2]:
+        if ranking_store is None:
+            panel_error('ranking')
+        else:
+            ranking_panel(ranking_store, selected_depart, selected_year)
+
 #######################################
+# Diagnostics, hidden unless the URL has ?diagnostics=1
 
-ranking = ranking[(ranking['departamento'] == selected_depart) & (ranking['año'] == selected_year)][['nombre_med_grupo']].head(15)
+perf.end_run()
 
-with col[2]:
-    st.markdown('### Top Medicamentos desabastecidos')
-    
-    st.dataframe(ranking,
-                 hide_index=True,
-                 width=None,
-                 column_config={
-                     'nombre_med_grupo': st.column_config.TextColumn('nombre_med_grupo')
-                 })
\ No newline at end of file
+if st.query_params.get('diagnostics') == '1':
+    with st.expander('Diagnóstico', expanded=True):
+        st.markdown('**Última ejecución (ms)**')
+        st.dataframe(pd.DataFrame([
+            {'seccion': name, 'ms': seconds * 1000} for name, seconds in st.session_state[perf.SESSION_KEY].items()
+        ]), hide_index=True)
+        st.markdown(f'**Últimas {perf.METRICS_WINDOW} ejecuciones del proceso**')
+        st.dataframe(pd.DataFrame(perf.METRICS.timings()), hide_index=True)
+        st.markdown('**Cachés**')
+        st.dataframe(pd.DataFrame(perf.METRICS.counters()), hide_index=True)
+        if perf.METRICS.events():
+            st.markdown('**Eventos**')
+            st.dataframe(pd.DataFrame(perf.METRICS.events()), hide_index=True)
+        if snapshot_root is not None:
+            st.markdown(f'**Snapshot** `{snapshot_root}`')
+            st.json(snapshot.read_manifest(snapshot_root))
+        else:
+            if geo_report is not None:
+                st.markdown('**Validación de establecimientos**')
+                st.dataframe(pd.DataFrame([geo_report.counts]), hide_index=True)
+                for warning in geo_report.warnings:
+                    st.warning(warning)
+            st.markdown('**Carga de tablas**')
+            for name, error in data.errors.items():
+                st.error(f'{name}: {error}')
+            st.dataframe(pd.DataFrame([
+                {**timing._asdict(), 'error': None if timing.error is None else str(timing.error)}
+                for timing in datasets.timings.values()
+            ]), hide_index=True)
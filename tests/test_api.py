@@ -0,0 +1,18 @@
+import numpy as np
+import pandas as pd
+
+import api
+
+
+def test_if_none_match_is_a_weak_comparison():
+    assert api._etag_matches('"abc"', '"abc"')
+    assert api._etag_matches('"abc"', '"x", W/"abc"')
+    assert api._etag_matches('"abc"', '*')
+    assert not api._etag_matches('"abc"', '"x"')
+    assert not api._etag_matches('"abc"', '')
+
+
+# float32 values come out as their shortest decimal
+def test_records_of_float32_columns():
+    df = pd.DataFrame({'idm': np.array([64.09489, np.nan], dtype='float32'), 'n': [1, 2]})
+    assert api._records(df) == [{'idm': 64.09489, 'n': 1}, {'idm': None, 'n': 2}]
@@ -0,0 +1,29 @@
+import openpyxl
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+import data_store
+
+
+def _workbook(path, rows):
+    book = openpyxl.Workbook()
+    for row in rows:
+        book.active.append(row)
+    book.save(path)
+
+
+# Cells past the header become 'Unnamed: N' columns, as with pd.read_excel,
+# whichever chunk the wider rows are in
+@pytest.mark.parametrize('chunk_rows', [1, 3, 100])
+def test_rows_wider_than_the_header(tmp_path, monkeypatch, chunk_rows):
+    monkeypatch.chdir(tmp_path)
+    path = 'book.xlsx'
+    _workbook(path, [['a', 'b']] + [[i, 2 * i] for i in range(7)] + [[7, 14, 'x'], [8, 16, None, 3.5]])
+
+    data_store.convert_workbook(path, chunk_rows)
+    converted = pq.read_table(data_store.columnar_path(path)).to_pandas()
+    expected = data_store.compact_dtypes(pd.read_excel(path))
+    assert converted.equals(expected)
+    assert list(converted.dtypes) == list(expected.dtypes)
+    assert list(converted.columns) == ['a', 'b', 'Unnamed: 2', 'Unnamed: 3']
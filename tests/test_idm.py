@@ -0,0 +1,24 @@
+import pandas as pd
+
+import idm
+
+
+def _facilities(rows):
+    return pd.DataFrame(rows, columns=['año', 'departamento', 'tipo'] + idm.COUNT_COLUMNS)
+
+
+# A type whose facilities have no medicines has no IDM: None, like a missing type
+def test_zero_total_type_has_no_idm():
+    facilities = _facilities([
+        (2024, 'LIMA', 'Hospital', 10, 1, 1, 8),
+        (2024, 'LIMA', 'Centro de salud', 0, 0, 0, 0),
+        (2024, 'LIMA', 'Puesto de Salud', 10, 0, 0, 10),
+    ])
+    index = idm.build_idm_index(idm.aggregate_idm(facilities))
+    assert index == {(2024, 'LIMA'): (90.0, 80.0, None, 100.0)}
+
+
+def test_missing_type_has_no_idm():
+    facilities = _facilities([(2024, 'LIMA', 'Hospital', 4, 0, 1, 3)])
+    index = idm.build_idm_index(idm.aggregate_idm(facilities))
+    assert index == {(2024, 'LIMA'): (75.0, 75.0, None, None)}
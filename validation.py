@@ -0,0 +1,60 @@
+##################################
+# Data-quality checks of the facility table
+#
+# Run once per loaded version of the table (see load_geo_report in
+# streamlit_app.py), not on every rerun. Errors stop the dashboard from
+# drawing the facility panels; warnings are only reported.
+from collections import namedtuple
+
+import pandas as pd
+
+import data_store
+#################################
+
+# Columns the facility panels read
+REQUIRED_COLUMNS = data_store.GEO_PARTITION_COLS + data_store.GEO_COLUMNS
+NUMERIC_COLUMNS = ['año', 'dispo', 'latitud', 'longitud']
+
+# Peru's bounding box, with a small margin
+PERU_LAT = (-18.5, 0.1)
+PERU_LON = (-81.5, -68.5)
+
+# ok is True when there are no errors. counts holds the number of rows behind
+# every check, for the diagnostics panel.
+ValidationReport = namedtuple('ValidationReport', ['ok', 'rows', 'errors', 'warnings', 'counts'])
+
+
+def validate_facilities(df):
+    errors, warnings, counts = [], [], {}
+
+    missing = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    counts['columnas_faltantes'] = len(missing)
+    if 'latitud' in missing or 'longitud' in missing:
+        errors.append("Las columnas 'latitud' y 'longitud' no existen en el DataFrame.")
+    elif missing:
+        errors.append(f"Faltan columnas en los datos de establecimientos: {', '.join(missing)}.")
+
+    wrong_dtype = [col for col in NUMERIC_COLUMNS if col in df.columns and not pd.api.types.is_numeric_dtype(df[col])]
+    counts['tipos_incorrectos'] = len(wrong_dtype)
+    if wrong_dtype:
+        errors.append(f"Columnas que deberían ser numéricas: {', '.join(wrong_dtype)}.")
+
+    if 'latitud' in df.columns and 'longitud' in df.columns and not wrong_dtype:
+        lat, lon = df['latitud'], df['longitud']
+        null_coords = int((lat.isna() | lon.isna()).sum())
+        counts['coordenadas_nulas'] = null_coords
+        if null_coords:
+            errors.append("Hay valores nulos en las columnas 'latitud' y 'longitud'.")
+
+        outside = int((lat.notna() & lon.notna() & ~(lat.between(*PERU_LAT) & lon.between(*PERU_LON))).sum())
+        counts['fuera_de_peru'] = outside
+        if outside:
+            warnings.append(f'{outside} establecimientos tienen coordenadas fuera del Perú.')
+
+    if 'codigo_pre' in df.columns and 'año' in df.columns:
+        duplicated = int(df.duplicated(['año', 'codigo_pre']).sum())
+        counts['codigos_duplicados'] = duplicated
+        if duplicated:
+            warnings.append(f'{duplicated} filas repiten el código de un establecimiento en el mismo año.')
+
+    return ValidationReport(not errors, len(df), errors, warnings, counts)
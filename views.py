@@ -0,0 +1,143 @@
+##################################
+# Dashboard views
+#
+# The selections the dashboard offers and how the content of each panel is
+# built from the loaded tables. streamlit_app.py caches what these return per
+# table version; snapshot.py renders every (año, departamento) offline with
+# the same functions.
+import charts
+import idm
+import spatial
+#################################
+
+YEARS = [2019, 2020, 2021, 2022, 2023, 2024]
+
+DEPARTMENTS = sorted([
+    'AMAZONAS', 'CAJAMARCA', 'AREQUIPA', 'AYACUCHO', 'APURIMAC',
+    'ANCASH', 'HUANUCO', 'ICA', 'HUANCAVELICA', 'CUSCO', 'CALLAO',
+    'UCAYALI', 'TUMBES', 'SANMARTIN', 'TACNA', 'PUNO', 'PIURA',
+    'PASCO', 'LORETO', 'MOQUEGUA', 'MADREDEDIOS', 'LIMA', 'LALIBERTAD',
+    'JUNIN', 'LAMBAYEQUE'
+])
+
+# Map detail levels -> zoom. The last one draws every facility.
+MAP_DETAIL_LEVELS = {
+    'Departamento': spatial.CLUSTER_ZOOMS[0],
+    'Provincia': spatial.CLUSTER_ZOOMS[1],
+    'Distrito': spatial.CLUSTER_ZOOMS[2],
+    'Establecimientos': spatial.POINTS_MIN_ZOOM,
+}
+
+# Boundary detail of the national map: 0.05 degrees is under a pixel at its zoom
+CHOROPLETH_TOLERANCE = 0.05
+
+# How many medicines the ranking panel lists
+RANKING_TOP_N = 15
+
+# Titles of the IDM donuts, in idm.IDM_TIPOS order
+DONUT_TITLES = (
+    'IDM Anual',
+    'IDM Anual - Hospitales',
+    'IDM Anual - Centros de Salud',
+    'IDM Anual - Puestos de Salud',
+)
+
+
+#################################
+# Structures built once per version of the tables. data is a registry.Snapshot.
+
+# Registry tables each structure is built from, to key its caches
+IDM_TABLES = ('idm_aggregates', 'idm_anual_data', 'idm_anual_hosp', 'idm_anual_cen', 'idm_anual_pue')
+SERIES_TABLES = ('idm_hospitales', 'idm_centros', 'idm_puestos')
+
+
+# Index of the annual IDM by (año, departamento). From the facility counts
+# when there are any, otherwise from the four workbooks.
+def build_idm_index(data):
+    aggregated = data.get('idm_aggregates')
+    if aggregated.empty:
+        aggregated = idm.stack_idm_tables([
+            data.get('idm_anual_data'),
+            data.get('idm_anual_hosp'),
+            data.get('idm_anual_cen'),
+            data.get('idm_anual_pue'),
+        ])
+    return idm.build_idm_index(aggregated)
+
+
+# Monthly IDM series of the three establishment types, in one sorted table
+def build_series_store(data):
+    return idm.SeriesStore([
+        data.get('idm_hospitales'),
+        data.get('idm_centros'),
+        data.get('idm_puestos'),
+    ])
+
+
+#################################
+# Panel content of one selection
+
+# IDM (total, hospitales, centros, puestos) of a selection, None where it has none
+def idm_values(idm_index, year, depart):
+    return idm_index.get((year, depart)) or (None,) * len(idm.IDM_TIPOS)
+
+
+# The four donuts as one chart
+def donuts_spec(values, depart):
+    return charts.make_donuts(tuple(zip(DONUT_TITLES, values)), depart)
+
+
+# Facility map of a selection at one zoom. Large selections send one marker
+# per cluster until the zoom reaches spatial.POINTS_MIN_ZOOM; get_lod returns
+# the clusters of spatial.build_lod() and is only called then.
+def map_figure(filtered_data, zoom, get_lod):
+    if filtered_data.empty or spatial.draws_points(filtered_data, zoom):
+        return charts.build_map_figure(filtered_data, zoom)
+    center = (filtered_data.iloc[0]['latitud'], filtered_data.iloc[0]['longitud'])
+    return charts.build_cluster_figure(get_lod()[zoom], center, zoom)
+
+
+# Monthly IDM lineplot of one department (rows of SeriesStore.depart)
+def lineplot_figure(df_lineplot):
+    import plotly.express as px
+
+    # Crear el line plot usando plotly
+    fig = px.line(
+        df_lineplot,
+        x="date", y="idm",
+        color="tipo",
+        labels={"idm": "IDM", "date": "Fecha"}
+    )
+
+    # Añadir las líneas horizontales de colores
+    fig.add_hrect(y0=90, y1=100, line_width=0, fillcolor="green", opacity=0.2, annotation_text="Bien", annotation_position="top left")
+    fig.add_hrect(y0=70, y1=90, line_width=0, fillcolor="yellow", opacity=0.2, annotation_text="Regular", annotation_position="top left")
+    fig.add_hrect(y0=50, y1=70, line_width=0, fillcolor="orange", opacity=0.2, annotation_text="Mal", annotation_position="top left")
+    fig.add_hrect(y0=35, y1=50, line_width=0, fillcolor="red", opacity=0.2, annotation_text="Muy mal", annotation_position="top left")
+
+    # Mover la leyenda a la parte inferior
+    fig.update_layout(
+        legend_title_text='Tipo de Establecimiento',
+        legend=dict(
+            orientation="h",
+            yanchor="top",
+            y=-0.2,  # Ajusta la posición vertical de la leyenda
+            xanchor="center",
+            x=0.5
+        )
+    )
+    return fig
+
+
+# National IDM map of one year, None without boundary data
+def choropleth_figure(boundaries, idm_index, year):
+    if boundaries is None:
+        return None
+    idm_by_depart = {depart: values[0] for (key_year, depart), values in idm_index.items()
+                     if key_year == year and values[0] is not None}
+    return charts.build_choropleth_figure(boundaries, idm_by_depart)
+
+
+# The RANKING_TOP_N medicines in shortage of a selection
+def top_shortages(ranking_store, depart, year):
+    return ranking_store.top(depart, year, RANKING_TOP_N)[['nombre_med_grupo']]